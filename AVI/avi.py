@@ -3,7 +3,7 @@
 """
 :author : Cyril MOINEAU
 :creation_date : 20/02/20
-:last_change_date : 20/02/20
+:last_change_date : 18/10/26
 :description : Estimation en utilisant l'hypothèse indépendance des variables entre chaque attributs.
 """
 import numpy as np
@@ -68,3 +68,40 @@ class Avi(object):
             res *= n
         res *= (1/self.nb_tuple) ** (len(tab_dim)-1)
         return res
+
+    def estimer_batch(self, tab_dim, zones):
+        """
+        Estimation de plusieurs zones portant sur les mêmes attributs en une seule fois.
+        Sur chaque dimension, le nombre de tuple jusqu'à une valeur x est obtenu par interpolation linéaire entre les
+        quantiles (chaque intervalle entre deux quantiles contient self.frequence tuples), ce qui correspond au calcul
+        de la méthode "estimation".
+        :param tab_dim: Liste des noms des attributs à estimer.
+        :param zones: Tableau de forme (nb_zone, len(tab_dim), 2) des intervalles [min, max] de chaque zone.
+        :return: np.ndarray des cardinalités estimées
+        """
+        zones = np.asarray(zones, dtype=np.float64)
+        res = np.ones(len(zones))
+        for cpt, dim in enumerate(tab_dim):
+            intervalle = self.intervalles[self.attributs.index(dim)]
+            nb_ds_dim = self.cumul(intervalle, zones[:, cpt, 1]) - self.cumul(intervalle, zones[:, cpt, 0])
+            res *= nb_ds_dim * self.frequence
+        res *= (1 / self.nb_tuple) ** (len(tab_dim) - 1)
+        return res
+
+    @staticmethod
+    def cumul(intervalle, x):
+        """
+        Renvoit, pour chaque valeur de x, le nombre (fractionnaire) d'intervalles entre quantiles situés avant x.
+        :param intervalle: Bornes (quantiles) triées d'une dimension.
+        :param x: Tableau de valeurs.
+        :return: np.ndarray
+        """
+        # Index de la première borne strictement supérieure à x
+        i = np.searchsorted(intervalle, x, side='right')
+        interieur = (i > 0) & (i < len(intervalle))
+        j = np.clip(i, 1, len(intervalle) - 1)
+        ecart = intervalle[j] - intervalle[j - 1]
+        # Deux quantiles consécutifs peuvent être égaux (colonnes entières, peu de valeurs distinctes)
+        fraction = np.divide(x - intervalle[j - 1], ecart, out=np.zeros_like(ecart, dtype=np.float64), where=ecart > 0)
+        return np.where(interieur, (i - 1) + fraction, np.where(i == 0, 0, len(intervalle) - 1))
+
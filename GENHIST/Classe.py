@@ -3,18 +3,18 @@
 """
 :author : Cyril MOINEAU
 :creation_date : 24/02/20
-:last_change_date : 03/04/20
+:last_change_date : 18/10/26
 :description : Définition d'un intervalle pour l'histogramme GENHIST.
 """
 from sys import getsizeof
 from copy import deepcopy
+import numpy as np
 
 
 class Classe(object):
     def __init__(self, intervalle, densite=0):
         self.boundary = intervalle
         self.densite = densite
-        self.voisin = []
 
     def copy(self):
         """
@@ -80,7 +80,7 @@ class Classe(object):
                     return 0
                 elif intervalle_a_estimer[d][1] < self.boundary[tab_dim[d]][1]:
                     surface_commune *= (intervalle_a_estimer[d][1] - intervalle_a_estimer[d][0])
-                elif intervalle_a_estimer[d][1] > self.boundary[tab_dim[d]][1]:
+                else:
                     surface_commune *= (self.boundary[tab_dim[d]][1] - intervalle_a_estimer[d][0])
         return (surface_commune/self.surface(tab_dim=tab_dim)) * self.densite
 
@@ -107,5 +107,36 @@ class Classe(object):
         size = 0
         size += getsizeof(self.boundary)
         size += getsizeof(self.densite)
-        size += getsizeof(self.voisin)
         return size
+
+
+def estimer_zones(bornes_inf, bornes_sup, densite, longueur, tab_dim, zones, taille_bloc=2 ** 20):
+    """
+    Estimation de plusieurs zones sur un ensemble de classes en une seule fois grâce au broadcasting numpy. Le calcul
+    est celui de la méthode "Classe.estimate_card" sommé sur toutes les classes. Une classe de largeur nulle selon une
+    dimension y est vue comme un point : elle est entièrement comptée si la zone le contient.
+    :param bornes_inf: Tableau des bornes inférieures des classes de forme (nb_classe, nb_dim)
+    :param bornes_sup: Tableau des bornes supérieures des classes de forme (nb_classe, nb_dim)
+    :param densite: Tableau des densités des classes de forme (nb_classe,)
+    :param longueur: Tableau des longueurs des classes selon chaque dimension de forme (nb_classe, nb_dim)
+    :param tab_dim: Liste des index des dimensions des zones.
+    :param zones: Tableau des zones de forme (nb_zone, len(tab_dim), 2)
+    :param taille_bloc: Nombre maximal d'éléments des tableaux intermédiaires, les zones sont traitées par paquet.
+    :return: Tableau des densités estimées de forme (nb_zone,)
+    """
+    zones = np.asarray(zones, dtype=np.float64)
+    borne_inf = bornes_inf[:, tab_dim]
+    borne_sup = bornes_sup[:, tab_dim]
+    largeur = longueur[:, tab_dim]
+    point = largeur == 0
+    largeur = np.where(point, 1, largeur)
+    resultat = np.empty(len(zones))
+    pas_bloc = max(1, taille_bloc // max(1, borne_inf.size))
+    for debut in range(0, len(zones), pas_bloc):
+        mini = zones[debut:debut + pas_bloc, np.newaxis, :, 0]
+        maxi = zones[debut:debut + pas_bloc, np.newaxis, :, 1]
+        # Part de chaque classe comprise dans chaque zone selon chaque dimension
+        commun = np.clip(np.minimum(maxi, borne_sup) - np.maximum(mini, borne_inf), 0, None)
+        fraction = np.where(point, (mini <= borne_inf) & (borne_inf <= maxi), commun / largeur)
+        resultat[debut:debut + pas_bloc] = fraction.prod(axis=2) @ densite
+    return resultat
@@ -3,163 +3,616 @@
 """
 :author : Cyril MOINEAU
 :creation_date : 21/02/20
-:last_change_date : 07/04/20
+:last_change_date : 18/10/26
 :description : Définition d'un histogramme GENHIST.
 """
 from GENHIST import Classe as intervalle
-import random
+from partage import MemoirePartagee, attacher_memoire, tableaux_partages, splitmix64, verifier_memoire_partagee
 # from matplotlib import patches
 # import matplotlib.pyplot as plt
 from sys import getsizeof
-from copy import deepcopy
-from utils import est_inclus, epsilon
+from concurrent.futures import ProcessPoolExecutor
+from heapq import heappush, heappop
 from pickle import dump
+import numpy as np
 
 
 class Genhist(object):
-    def __init__(self, data_set, attributes_name, b, xi, alpha, verbeux=False):
+    def __init__(self, data_set, attributes_name, b, xi, alpha, verbeux=False, creuse=False, graine=None,
+                 nb_processus=None, nb_max_classe=None):
         """
         Initialisation d'un histogramme genhist
-        :param data_set: list /!\ Cette variable va subir des modifications, on en fait une copie au début du script /!\
+        :param data_set: list ou np.ndarray de forme (nb_dim, nb_tuple). Le jeu de données n'est pas modifié : on travaille
+        sur une copie contiguë en float64.
         :param attributes_name: list liste des noms des attributs pour pouvoir faire les estimations
         :param b:
         :param xi: Fixe le nombre d'intervalle obtenue lors des partitionnements (intervalle temporaire permettant la
         création de l'histogramme. Si xi trop grand (ie: xi^nb_dim), alors on risque de faire exploser la complexité.
         :param alpha: Variable influant sur l'évolution de xi, recommandé d'initialiser à (1/2)^(1/nb_dim)
         :param verbeux: boolean : Optionnel, affiche la progression de construction de l'histogramme.
+        :param creuse: boolean : Optionnel, la grille de partitionnement ne contient que les intervalles non vides
+        (dictionnaire {id_intervalle: densité}). À utiliser lorsque xi^nb_dim est grand devant le nombre de tuple.
+        :param graine: Optionnel, graine du générateur aléatoire numpy utilisé pour retirer les points. Avec une graine
+        fixée, la construction est reproductible.
+        :param nb_processus: int : Optionnel, nombre de processus utilisés pour calculer les densités de chaque
+        partition (le jeu de données est placé en mémoire partagée et découpé en tranches). Le résultat est identique à
+        la construction séquentielle. Nécessite Python 3.8 ou plus.
+        :param nb_max_classe: int : Optionnel, nombre maximum de classes de l'histogramme (au moins 1). Lorsqu'il est
+        dépassé, les classes sont fusionnées deux à deux (cf. fusionner_classes).
         """
-        # On fait une copie du jeu de données car nous aurons besoin de le maniuler dans la suite
-        # Note: deepcopy ne fonctionne pas à cause d'une erreur de récursion
-        data_set = deepcopy(data_set)
-        data_set = [list(d) for d in data_set]
-        self.min_max = [(min(a), max(a)) for a in data_set]
+        if nb_max_classe is not None and nb_max_classe < 1:
+            raise ValueError('ERREUR : nb_max_classe doit être au moins égal à 1 (reçu ' + str(nb_max_classe) + ') !')
+        if nb_processus is not None:
+            verifier_memoire_partagee()
+        # On fait une copie du jeu de données car nous aurons besoin de le manipuler dans la suite. Une seule copie en
+        # float64 suffit, qu'on reçoive une liste de listes ou un tableau numpy.
+        data_set = np.array(data_set, dtype=np.float64, order='C')
+        # Bornes des points restants, mises à jour au fil des suppressions et partagées par tous les tours
+        bornes = (data_set.min(axis=1), data_set.max(axis=1))
+        self.min_max = list(zip(bornes[0].tolist(), bornes[1].tolist()))
         self.verbeux = verbeux
         self.n = len(data_set[0])  # On définit le nombre de tuple
         self.attributes_name = attributes_name
         self.tab_classe = []
         self.tot_nb_point_remove = 0
+        self.rng = np.random.default_rng(graine)
+        self.creuse = creuse
+        self.nb_processus = nb_processus
+        self.nb_max_classe = nb_max_classe
+        if nb_processus is None:
+            self.build(data_set, b, xi, alpha, bornes)
+        else:
+            self.build_parallele(data_set, b, xi, alpha, bornes)
+        self.fusionner_classes()
+        self.empaqueter()
 
+    def build(self, data_set, b, xi, alpha, bornes, executeur=None, id_points=None):
+        """
+        Construction de l'histogramme : à chaque tour, on partitionne les points restants, les intervalles plus denses
+        que leurs voisins deviennent des classes et on retire des points de ces intervalles.
+        :param data_set: np.ndarray de forme (nb_dim, nb_tuple), modifié en place
+        :param b:
+        :param xi:
+        :param alpha:
+        :param bornes: (mini, maxi) bornes de data_set selon chaque dimension
+        :param executeur: cf. partitionning
+        :param id_points: cf. partitionning
+        :return: None
+        """
         construction_in_progress = True
         while construction_in_progress:
-            partition = self.partitionning(data_set, xi)
-            # On prends les b plus grandes densité
-            partition = sorted(partition, reverse=True, key=lambda x: x.densite)[:b]
-            for inter in partition:
-                moyenne = 0  # Calcul de la densité moyenne des voisins
-                for v in inter.voisin:
-                    moyenne += v.densite
-                moyenne = moyenne / len(inter.voisin)
-                if inter.densite > moyenne:
-                    data_set = self.supprimer_elts(inter, moyenne, data_set)
-                    inter.densite = (inter.densite - moyenne)
-                    self.tab_classe.append(inter.copy())
-
-            tmp = (len(data_set[0]) / (len(data_set[0]) + self.tot_nb_point_remove)) ** (1/len(data_set))
-            xi = int(min(tmp, alpha) * xi)  # On veut la partie entière du nombre
+            densite, mini, pas, id_intervalle = self.partitionning(data_set, xi, bornes, executeur, id_points)
+            garder = np.ones(len(data_set[0]), dtype=bool)
+            retenus = self.choisir_intervalles(densite, xi, mini, pas, b)
+            if retenus:
+                points, debuts, rang = self.regrouper_points(id_intervalle, [r[0] for r in retenus],
+                                                             None if isinstance(densite, dict) else densite.size)
+                for (_, d, moyenne), r in zip(retenus, rang):
+                    self.supprimer_elts(points[debuts[r]:debuts[r + 1]], d, moyenne, garder)
+            self.fusionner_classes()
+            # Les points conservés sont ramenés au début du tableau
+            nb_restant = int(garder.sum())
+            retires = data_set[:, ~garder]
+            data_set[:, :nb_restant] = data_set[:, garder]
+            data_set = data_set[:, :nb_restant]
+            if nb_restant > 0:
+                bornes = self.mettre_a_jour_bornes(data_set, retires, bornes)
+
+            xi = self.reduire_xi(xi, alpha, len(data_set[0]), len(data_set))
             if len(data_set[0]) == 0:
                 construction_in_progress = False
             elif xi <= 1:
                 self.tab_classe.append(
-                    intervalle.Classe([(min(data_set[d]), max(data_set[d])) for d in range(len(data_set))]
+                    intervalle.Classe(list(zip(bornes[0].tolist(), bornes[1].tolist()))
                                       , densite=len(data_set[0])/self.n))
                 construction_in_progress = False
 
-    def supprimer_elts(self, inter, densite_moyenne, data_set):
+    def build_parallele(self, data_set, b, xi, alpha, bornes):
+        """
+        Construction parallèle : le jeu de données et l'identifiant de l'intervalle de chaque point sont placés en
+        mémoire partagée, à chaque tour chaque processus calcule les identifiants et les effectifs d'une tranche de
+        points, les effectifs sont ensuite sommés. Les points sont toujours retirés par le processus principal, le
+        résultat est donc identique à celui de la construction séquentielle.
+        :param data_set: np.ndarray de forme (nb_dim, nb_tuple)
+        :param b:
+        :param xi:
+        :param alpha:
+        :param bornes: cf. build
+        :return: None
+        """
+        memoire = MemoirePartagee([('data_set', data_set.shape, np.float64),
+                                   ('id_points', data_set.shape[1:], np.int64)])
+        with memoire as tableaux:
+            donnees, id_points = tableaux['data_set'], tableaux['id_points']
+            donnees[:] = data_set
+            del data_set, tableaux
+            with ProcessPoolExecutor(max_workers=self.nb_processus, initializer=attacher_memoire,
+                                     initargs=(memoire.description,)) as executeur:
+                self.build(donnees, b, xi, alpha, bornes, executeur, id_points)
+            del donnees, id_points
+
+    @staticmethod
+    def mettre_a_jour_bornes(data_set, retires, bornes):
+        """
+        Met à jour les bornes des points restants après une suppression. Une borne n'est recalculée que si un des points
+        retirés l'atteignait.
+        :param data_set: Points restants de forme (nb_dim, nb_tuple)
+        :param retires: Points retirés de forme (nb_dim, nb_retire)
+        :param bornes: (mini, maxi) bornes avant la suppression
+        :return: (mini, maxi)
         """
-        Enlève des points de manière aléatoire de data_set et renvoit le data_set modifié.
-        nb_point_to_remove = round((inter.densite - densite_moyenne) * self.n)
-        :param inter:
+        mini, maxi = bornes
+        if retires.shape[1] == 0:
+            return bornes
+        mini, maxi = mini.copy(), maxi.copy()
+        for d in np.flatnonzero(retires.min(axis=1) <= mini).tolist():
+            mini[d] = data_set[d].min()
+        for d in np.flatnonzero(retires.max(axis=1) >= maxi).tolist():
+            maxi[d] = data_set[d].max()
+        return mini, maxi
+
+    @staticmethod
+    def regrouper_points(id_intervalle, id_retenus, nb_intervalle=None):
+        """
+        Regroupe, en une seule passe sur les points, les points des intervalles retenus par intervalle. On calcule le
+        rang de l'intervalle de chaque point parmi les intervalles retenus triés (par une table de correspondance pour une
+        grille dense, par recherche dichotomique pour une grille creuse), puis on trie de manière stable les seuls points
+        des intervalles retenus selon ce rang. Le rang est stocké sur le plus petit type entier possible : numpy trie
+        alors les entiers de 8 ou 16 bits par base, en temps linéaire.
+        :param id_intervalle: Identifiant de l'intervalle de chaque point
+        :param id_retenus: Liste des identifiants (distincts) des intervalles retenus
+        :param nb_intervalle: Nombre d'intervalle de la grille, None pour une grille creuse
+        :return: (points, debuts, rang) : les points de l'intervalle id_retenus[i] sont
+        points[debuts[rang[i]]:debuts[rang[i] + 1]], dans l'ordre croissant de leur index.
+        """
+        id_retenus = np.array(id_retenus, dtype=np.int64)
+        tri = np.argsort(id_retenus)
+        nb_retenu = len(id_retenus)
+        if nb_intervalle is None:
+            id_tries = id_retenus[tri]
+            rang_points = np.minimum(np.searchsorted(id_tries, id_intervalle), nb_retenu - 1)
+            points = np.flatnonzero(id_tries[rang_points] == id_intervalle)
+        else:
+            table = np.full(nb_intervalle, -1, dtype=np.int64)
+            table[id_retenus[tri]] = np.arange(nb_retenu)
+            rang_points = table[id_intervalle]
+            points = np.flatnonzero(rang_points >= 0)
+        rang_points = rang_points[points].astype(np.min_scalar_type(nb_retenu))
+        ordre = np.argsort(rang_points, kind='stable')
+        debuts = np.searchsorted(rang_points[ordre], np.arange(nb_retenu + 1)).tolist()
+        rang = np.empty(nb_retenu, dtype=np.int64)
+        rang[tri] = np.arange(nb_retenu)
+        return points[ordre], debuts, rang.tolist()
+
+    def supprimer_elts(self, points, densite, densite_moyenne, garder):
+        """
+        Choisit aléatoirement des points de l'intervalle à retirer du jeu de données.
+        nb_point_to_remove = round((densite - densite_moyenne) * self.n)
+        :param points: Index (croissants) des points de l'intervalle dans le jeu de données
+        :param densite:
         :param densite_moyenne:
-        :param data_set:
+        :param garder: Masque des points conservés, modifié en place
         :return:
         """
-        nb_point_to_remove = round((inter.densite - densite_moyenne) * self.n)
+        nb_point_to_remove = min(round((densite - densite_moyenne) * self.n), len(points))
         self.tot_nb_point_remove += nb_point_to_remove
-        cpt = len(data_set[0]) - 1
-        nb_pt_rm = 0
-        while nb_pt_rm != nb_point_to_remove:  # Parcour inverse du tableau pour éviter les problèmes d'index
-            if cpt == -1:
-                cpt = len(data_set[0]) - 1
-            if random.random() > 0.5:  # TODO : Faire une suppression plus intelligente ?
-                for d in range(len(data_set)):
-                    del data_set[d][cpt]
-                nb_pt_rm += 1
-            cpt -= 1
-        return data_set
-
-    def partitionning(self, data, xi):
-        '''
-        Cette fonction renvoit (xi ** d) intervalles de largeur égale. Où d = nb de dimension de data.
+        garder[self.rng.choice(points, size=nb_point_to_remove, replace=False)] = False
+
+    def partitionning(self, data, xi, bornes, executeur=None, id_points=None):
+        '''
+        Découpe l'espace en (xi ** d) intervalles de largeur égale (où d = nb de dimension de data) et calcul la densité
+        de chacun d'eux.
         :param data:
         :param xi:
-        :return:
+        :param bornes: (mini, maxi) bornes de data selon chaque dimension
+        :param executeur: Optionnel, ProcessPoolExecutor dont les processus sont attachés à la mémoire partagée (cf.
+        build_parallele), data est alors le début du tableau partagé.
+        :param id_points: Tableau partagé recevant l'identifiant de l'intervalle de chaque point (avec executeur).
+        :return: (densite, mini, pas, id_intervalle) où densite est un tableau de forme (xi, ..., xi)
+        (densite[c_0, ..., c_(d-1)] est la densité de l'intervalle en position c_d selon la dimension d), ou pour une
+        grille creuse un dictionnaire {id_intervalle: densité} des intervalles non vides, mini et pas donnent l'origine
+        et le pas de la grille selon chaque dimension et id_intervalle l'identifiant de l'intervalle de chaque point.
         '''
         if self.verbeux:
             print('Création d\'une nouvelle partition de ', xi ** len(data), ' intervalles')
-        tab_intervalle = []
-        tab_min_max = [(min(i), max(i)) for i in data]
-        tab_pas = [(i[1] - i[0]) / xi for i in tab_min_max]
-        tab_avancement = [i[0] for i in tab_min_max]
-        nb_dim = len(tab_min_max)
-        terminaison = False  # Boolean pour simuler une boucle do-while
-        while not terminaison:
-            new_boundary = [[tab_avancement[i], tab_avancement[i] + tab_pas[i]] for i in range(nb_dim)]
-            tab_intervalle.append(intervalle.Classe(new_boundary))
-            dim = 0
-            maj_pas = True
-            while maj_pas:
-                if dim == nb_dim:  # On a atteint la fin
-                    maj_pas = False
-                    terminaison = True
-                else:
-                    # Si avancer nous fait dépasser alors, on revient à 0 pour cette dimension et on incrémente la dimension
-                    if tab_avancement[dim] + (2 * tab_pas[dim]) > tab_min_max[dim][1] + epsilon:
-                        tab_avancement[dim] = tab_min_max[dim][0]  # On reset l'avancement de cette dimension
-                        dim += 1
-                    # Si on peut avancer alors on avance et on arrête notre mise à jour
-                    else:
-                        tab_avancement[dim] = tab_avancement[dim] + tab_pas[dim]
-                        maj_pas = False
-
-        # Mis à jour des voisins =======================================================================================
-        '''
-                a b c
-                d e f   => [a, b, c, d, e, f, g, h, i]
-                g h i
-        On à aplatit la "matrice de partitionnement", on va donc travailler avec des modulos pour trouver les voisins.
-        '''
-        for i in range(len(tab_intervalle)):
-            # Selon chaque dimension, un intervalle possède au mieux deux voisins
-            for dim in range(nb_dim):
-                # Test pour savoir si on est tout à droite
-                if (i + 1) % (xi ** (dim + 1)) == 1 and i + xi ** dim in range(len(tab_intervalle)):
-                    tab_intervalle[i].voisin.append(tab_intervalle[i + xi ** dim])
-                # Test pour savoir si on est tout à gauche
-                elif (i + 1) % (xi ** (dim + 1)) == 0 and i - xi ** dim in range(len(tab_intervalle)):
-                    tab_intervalle[i].voisin.append(tab_intervalle[i - xi ** dim])
-                else:
-                    if i - (xi ** dim) in range(len(tab_intervalle)):
-                        tab_intervalle[i].voisin.append(tab_intervalle[i - xi ** dim])
-                    if i + (xi ** dim) in range(len(tab_intervalle)):
-                        tab_intervalle[i].voisin.append(tab_intervalle[i + xi ** dim])
-
-        # Mise à jour de la densité ====================================================================================
-        for i in range(len(data[0])):
-            point = [d[i] for d in data]
-            if self.verbeux:
-                print('Mise à jour de la densité :', i, '/', len(data[0]))
-            # TODO : Ici on parcourt linéairement nos intervalles partitionné, or justement ils partitionnent l'espace,
-            #  on pourrait utiliser cette propriétés pour trouver plus rapidement à quelle boundary appartient le point.
-            maj_pas = True
-            cpt_intervalle = 0
-            while maj_pas:
-                if est_inclus(point, tab_intervalle[cpt_intervalle].boundary):
-                    tab_intervalle[cpt_intervalle].densite += 1
-                    maj_pas = False
-                cpt_intervalle += 1
-        for inter in tab_intervalle:
-            inter.densite = inter.densite / self.n
-        return tab_intervalle
+        mini, maxi = bornes
+        nb_dim = len(mini)
+        pas = (maxi - mini) / xi
+
+        if executeur is None:
+            id_intervalle = self.id_intervalles(data, mini, pas, xi)
+            effectif = compter_intervalles(id_intervalle, xi ** nb_dim, self.creuse)
+        else:
+            nb_tuple = len(data[0])
+            taille = -(-nb_tuple // self.nb_processus)
+            tranches = [(debut, min(debut + taille, nb_tuple), mini, pas, xi, self.creuse)
+                        for debut in range(0, nb_tuple, taille)]
+            effectif = fusionner_comptes(list(executeur.map(compter_partage, tranches)), self.creuse)
+            id_intervalle = id_points[:nb_tuple]
+        if self.creuse:
+            densite = dict(zip(effectif[0].tolist(), (effectif[1] / self.n).tolist()))
+        else:
+            densite = (effectif / self.n).reshape((xi,) * nb_dim, order='F')
+        return densite, mini, pas, id_intervalle
+
+    @staticmethod
+    def id_intervalles(data, mini, pas, xi, taille_bloc=2 ** 16):
+        '''
+        Calcul l'identifiant de l'intervalle de la grille contenant chaque point. La grille est régulière : l'intervalle
+        d'un point se calcule directement à partir de ses coordonnées.
+        Les intervalles sont numérotés en faisant varier la première dimension le plus rapidement :
+        i = c_0 + c_1 * xi + ... + c_(d-1) * xi^(d-1) où c_d est la position de l'intervalle selon la dimension d.
+        :param data: Tableau de forme (nb_dim, nb_tuple)
+        :param mini: Origine de la grille selon chaque dimension
+        :param pas: Pas de la grille selon chaque dimension
+        :param xi: Nombre d'intervalle selon chaque dimension
+        :param taille_bloc: Nombre de points convertis en entier à la fois (cf. ci-dessous)
+        :return: np.ndarray des identifiants
+        '''
+        if xi ** len(mini) > np.iinfo(np.int64).max:
+            raise ValueError('Grille de ' + str(xi) + '^' + str(len(mini)) + ' intervalles trop grande pour numéroter '
+                             'les intervalles sur 64 bits, il faut diminuer xi.')
+        # L'identifiant est accumulé dimension par dimension (schéma de Horner en partant de la dernière dimension) : en
+        # plus du résultat, on n'alloue qu'une ligne de flottants de la taille du jeu de données. Les positions sont
+        # converties en entier par tranches pour que l'identifiant reste exact au delà de 2^53.
+        data = np.asarray(data, dtype=np.float64)
+        nb_tuple = data.shape[1]
+        id_intervalle = np.zeros(nb_tuple, dtype=np.int64)
+        position = np.empty(nb_tuple)
+        for dim in reversed(range(len(mini))):
+            id_intervalle *= xi
+            if pas[dim] == 0:
+                # Si une dimension est constante (pas nul), tous les points sont dans le premier intervalle
+                continue
+            np.subtract(data[dim], mini[dim], out=position)
+            position /= pas[dim]
+            np.floor(position, out=position)
+            np.clip(position, 0, xi - 1, out=position)
+            for debut in range(0, nb_tuple, taille_bloc):
+                id_intervalle[debut:debut + taille_bloc] += position[debut:debut + taille_bloc].astype(np.int64)
+        return id_intervalle
+
+    def choisir_intervalles(self, densite, xi, mini, pas, b):
+        '''
+        Parmi les b intervalles les plus denses de la grille, retient ceux qui sont plus denses que leurs voisins et ajoute
+        à l'histogramme une classe de densité (densite - densite_moyenne) pour chacun d'eux.
+        :param densite: Tableau des densités de forme (xi, ..., xi) ou dictionnaire pour une grille creuse (voir
+        partitionning), modifié en place
+        :param xi:
+        :param mini:
+        :param pas:
+        :param b:
+        :return: Liste de (id_intervalle, densite, densite_moyenne) des intervalles retenus
+        '''
+        if isinstance(densite, dict):
+            return self.choisir_intervalles_creuse(densite, xi, mini, pas, b)
+        moyenne, nb_voisin = self.densite_moyenne_voisins(densite)
+        # On prends les b plus grandes densité
+        plat = densite.ravel(order='F')
+        meilleurs = plus_denses(np.arange(plat.size), plat, b)
+        retenus = []
+        positions = zip(*np.unravel_index(meilleurs, densite.shape, order='F'))
+        for id_intervalle, position in zip(meilleurs.tolist(), positions):
+            if densite[position] > moyenne[position]:
+                retenus.append((id_intervalle, float(densite[position]), float(moyenne[position])))
+                self.tab_classe.append(self.creer_intervalle(position, mini, pas,
+                                                             densite[position] - moyenne[position]))
+                # La densité de l'intervalle diminue, ce qui fait baisser la densité moyenne autour de ses voisins
+                self.retirer_densite_voisins(position, moyenne[position], moyenne, nb_voisin)
+                densite[position] -= moyenne[position]
+        return retenus
+
+    def choisir_intervalles_creuse(self, densite, xi, mini, pas, b):
+        '''
+        Version de choisir_intervalles pour une grille creuse. La densité moyenne des voisins n'est calculée que pour
+        les b intervalles les plus denses, un voisin absent du dictionnaire étant vide. Les calculs sont faits dans le
+        même ordre que pour la grille dense (cf. densite_moyenne_voisins et retirer_densite_voisins) : les deux grilles
+        donnent les mêmes classes.
+        :param densite: dictionnaire {id_intervalle: densité} des intervalles non vides, modifié en place
+        :param xi:
+        :param mini:
+        :param pas:
+        :param b:
+        :return: Liste de (id_intervalle, densite, densite_moyenne) des intervalles retenus
+        '''
+        id_non_vide = np.fromiter(densite.keys(), dtype=np.int64, count=len(densite))
+        valeurs = np.fromiter(densite.values(), dtype=np.float64, count=len(densite))
+        # On prends les b plus grandes densité
+        meilleurs = id_non_vide[plus_denses(id_non_vide, valeurs, b)].tolist()
+        # Densité moyenne des voisins de chacun de ces intervalles, avant tout retrait
+        positions = {}
+        voisins = {}
+        moyenne = {}
+        for id_intervalle in meilleurs:
+            position = np.unravel_index(id_intervalle, (xi,) * len(mini), order='F')
+            positions[id_intervalle] = position
+            voisins[id_intervalle] = []
+            for dim in range(len(mini)):
+                # Selon chaque dimension, un intervalle possède au mieux deux voisins
+                if position[dim] > 0:
+                    voisins[id_intervalle].append(id_intervalle - xi ** dim)
+                if position[dim] < xi - 1:
+                    voisins[id_intervalle].append(id_intervalle + xi ** dim)
+            somme = 0.
+            for v in voisins[id_intervalle]:
+                somme += densite.get(v, 0.)
+            moyenne[id_intervalle] = somme / len(voisins[id_intervalle]) if voisins[id_intervalle] else 0.
+        retenus = []
+        for id_intervalle in meilleurs:
+            if densite[id_intervalle] > moyenne[id_intervalle]:
+                retenus.append((id_intervalle, densite[id_intervalle], moyenne[id_intervalle]))
+                self.tab_classe.append(self.creer_intervalle(positions[id_intervalle], mini, pas,
+                                                             densite[id_intervalle] - moyenne[id_intervalle]))
+                # La densité de l'intervalle diminue, ce qui fait baisser la densité moyenne autour de ses voisins
+                for v in voisins[id_intervalle]:
+                    if v in moyenne:
+                        moyenne[v] -= moyenne[id_intervalle] / len(voisins[v])
+                densite[id_intervalle] -= moyenne[id_intervalle]
+        return retenus
+
+    def fusionner_classes(self):
+        """
+        Tant que l'histogramme possède plus de nb_max_classe classes, fusionne les deux classes qui se touchent (ou se
+        chevauchent) dont la fusion introduit la plus petite erreur d'estimation (cf. erreur_fusion). La classe
+        fusionnée est la boîte englobante des deux classes, sa densité est la somme de leurs densités. Les paires sont
+        rangées dans un tas, une paire dont une des classes a déjà été fusionnée est ignorée lorsqu'elle est retirée du
+        tas. S'il n'y a plus de classes qui se touchent, toutes les paires de classes sont considérées.
+        :return: None
+        """
+        if self.nb_max_classe is None or len(self.tab_classe) <= self.nb_max_classe:
+            return
+        nb_classe = len(self.tab_classe)
+        nb_dim = len(self.attributes_name)
+        # Chaque fusion crée une nouvelle classe à la fin des tableaux
+        capacite = 2 * nb_classe
+        bornes = np.array([inter.boundary for inter in self.tab_classe], dtype=np.float64).reshape(nb_classe, nb_dim, 2)
+        inf = np.empty((capacite, nb_dim))
+        sup = np.empty((capacite, nb_dim))
+        densite = np.zeros(capacite)
+        vivante = np.zeros(capacite, dtype=bool)
+        inf[:nb_classe] = bornes[:, :, 0]
+        sup[:nb_classe] = bornes[:, :, 1]
+        densite[:nb_classe] = [inter.densite for inter in self.tab_classe]
+        vivante[:nb_classe] = True
+
+        tas = []
+        toutes_les_paires = False
+
+        def ajouter_paires(i, candidates):
+            candidates = candidates[vivante[candidates]]
+            if not toutes_les_paires:
+                # On ne garde que les classes qui touchent la classe i
+                candidates = candidates[((inf[candidates] <= sup[i]) & (inf[i] <= sup[candidates])).all(axis=1)]
+            erreurs = erreur_fusion(inf[i], sup[i], densite[i], inf[candidates], sup[candidates], densite[candidates])
+            for erreur, j in zip(erreurs.tolist(), candidates.tolist()):
+                heappush(tas, (erreur, j, i))
+
+        for i in range(nb_classe):
+            ajouter_paires(i, np.arange(i + 1, nb_classe))
+        nb_vivante = nb_classe
+        suivante = nb_classe
+        while nb_vivante > self.nb_max_classe:
+            if not tas:
+                toutes_les_paires = True
+                vivantes = np.flatnonzero(vivante)
+                for rang, i in enumerate(vivantes.tolist()):
+                    ajouter_paires(i, vivantes[rang + 1:])
+            _, i, j = heappop(tas)
+            if not (vivante[i] and vivante[j]):
+                continue
+            inf[suivante] = np.minimum(inf[i], inf[j])
+            sup[suivante] = np.maximum(sup[i], sup[j])
+            densite[suivante] = densite[i] + densite[j]
+            vivante[i] = vivante[j] = False
+            vivante[suivante] = True
+            nb_vivante -= 1
+            ajouter_paires(suivante, np.arange(suivante))
+            suivante += 1
+
+        vivantes = np.flatnonzero(vivante)
+        self.tab_classe = [intervalle.Classe(np.stack([inf[i], sup[i]], axis=1).tolist(), densite=densite[i].item())
+                           for i in vivantes]
+
+    def reduire_xi(self, xi, alpha, nb_restant, nb_dim):
+        '''
+        Calcul le nombre d'intervalle par dimension du tour suivant.
+        :param xi:
+        :param alpha:
+        :param nb_restant: Nombre de tuple restant
+        :param nb_dim:
+        :return: int
+        '''
+        tmp = (nb_restant / (nb_restant + self.tot_nb_point_remove)) ** (1 / nb_dim)
+        return int(min(tmp, alpha) * xi)  # On veut la partie entière du nombre
+
+    @staticmethod
+    def densite_moyenne_voisins(densite):
+        '''
+        Calcul pour chaque intervalle de la grille la densité moyenne de ses voisins. Selon chaque dimension, un
+        intervalle possède au mieux deux voisins (la grille n'est pas circulaire).
+        :param densite: Tableau des densités de forme (xi, ..., xi)
+        :return: (moyenne, nb_voisin) tableaux de même forme que densite
+        '''
+        somme = np.zeros(densite.shape)
+        nb_voisin = np.zeros(densite.shape)
+        for dim in range(densite.ndim):
+            # On décale la grille d'un intervalle selon la dimension dim, dans un sens puis dans l'autre
+            gauche = [slice(None)] * densite.ndim
+            droite = [slice(None)] * densite.ndim
+            gauche[dim] = slice(None, -1)
+            droite[dim] = slice(1, None)
+            somme[tuple(droite)] += densite[tuple(gauche)]
+            somme[tuple(gauche)] += densite[tuple(droite)]
+            nb_voisin[tuple(droite)] += 1
+            nb_voisin[tuple(gauche)] += 1
+        return np.divide(somme, nb_voisin, out=np.zeros(densite.shape), where=nb_voisin > 0), nb_voisin
+
+    @staticmethod
+    def retirer_densite_voisins(position, densite_retiree, moyenne, nb_voisin):
+        '''
+        Met à jour la densité moyenne des voisins d'un intervalle dont la densité vient de diminuer.
+        :param position: tuple, position de l'intervalle dans la grille
+        :param densite_retiree: float
+        :param moyenne: Tableau des densités moyennes (modifié en place)
+        :param nb_voisin: Tableau du nombre de voisins de chaque intervalle
+        :return:
+        '''
+        for dim in range(len(position)):
+            for decalage in (-1, 1):
+                voisin = list(position)
+                voisin[dim] += decalage
+                if 0 <= voisin[dim] < moyenne.shape[dim]:
+                    voisin = tuple(voisin)
+                    moyenne[voisin] -= densite_retiree / nb_voisin[voisin]
+
+    @staticmethod
+    def creer_intervalle(position, mini, pas, densite):
+        '''
+        Créer l'intervalle de la grille se trouvant à la position donnée.
+        :param position: tuple, position de l'intervalle selon chaque dimension
+        :param mini:
+        :param pas:
+        :param densite:
+        :return: Classe
+        '''
+        position = np.array(position)
+        borne_inf = (mini + position * pas).tolist()
+        borne_sup = (mini + (position + 1) * pas).tolist()
+        return intervalle.Classe([[i, s] for i, s in zip(borne_inf, borne_sup)], densite=float(densite))
+
+    @classmethod
+    def depuis_blocs(cls, source, attributes_name, b, xi, alpha, verbeux=False, creuse=False, graine=None,
+                     nb_max_classe=None):
+        """
+        Construction pour des jeux de données trop volumineux pour la mémoire. Chaque tour de partitionnement est une
+        passe sur les données, la densité de la grille est accumulée bloc par bloc. Les points ne sont pas supprimés
+        physiquement : chaque tour conserve, pour chaque intervalle retenu, la proportion de points à retirer et les passes
+        suivantes retirent les points à la volée (tirage reproductible à partir de l'index global du tuple).
+        Différences avec la construction en mémoire : le nombre de points retirés dans un intervalle est exact en moyenne
+        seulement, et la grille d'un tour est construite sur les bornes des points restant au début du tour précédent
+        (elles contiennent les points restants mais peuvent être un peu plus larges).
+        :param source: Fonction sans paramètre renvoyant un itérable de blocs de données, chaque bloc étant un tableau
+        de forme (nb_dim, nb_tuple_du_bloc). Elle est appelée une fois par passe et doit renvoyer les blocs dans le même
+        ordre à chaque fois.
+        :param attributes_name: list liste des noms des attributs pour pouvoir faire les estimations
+        :param b: cf. constructeur.
+        :param xi: cf. constructeur.
+        :param alpha: cf. constructeur.
+        :param verbeux: boolean : Optionnel, affiche la progression de construction de l'histogramme.
+        :param creuse: boolean : cf. constructeur.
+        :param graine: Optionnel, graine du tirage des points retirés. Avec une graine fixée, la construction est
+        reproductible.
+        :param nb_max_classe: int : cf. constructeur.
+        :return: Genhist
+        """
+        if nb_max_classe is not None and nb_max_classe < 1:
+            raise ValueError('ERREUR : nb_max_classe doit être au moins égal à 1 (reçu ' + str(nb_max_classe) + ') !')
+        histo = cls.__new__(cls)
+        histo.verbeux = verbeux
+        histo.attributes_name = attributes_name
+        histo.tab_classe = []
+        histo.tot_nb_point_remove = 0
+        histo.rng = np.random.default_rng(graine)
+        histo.creuse = creuse
+        histo.nb_processus = None
+        histo.nb_max_classe = nb_max_classe
+        cle = int(histo.rng.integers(2 ** 63))
+        nb_dim = len(attributes_name)
+        # (xi, mini, pas, id des intervalles retenus (triés), proportion de points retirés de ces intervalles) de
+        # chaque tour
+        tours = []
+
+        # Première passe : nombre de tuple et bornes du jeu de données =================================================
+        nb_restant, mini, maxi = histo.statistiques_blocs(source, tours, nb_dim, cle)
+        histo.n = nb_restant
+        histo.min_max = list(zip(mini.tolist(), maxi.tolist()))
+
+        while nb_restant > 0 and xi > 1:
+            if histo.verbeux:
+                print('Création d\'une nouvelle partition de ', xi ** nb_dim, ' intervalles')
+            pas = (maxi - mini) / xi
+            # Les effectifs sont comptés bloc par bloc comme pour la construction parallèle (cf. compter_intervalles)
+            effectif = compter_intervalles(np.empty(0, dtype=np.int64), xi ** nb_dim, creuse)
+            nouveau_mini = np.full(nb_dim, np.inf)
+            nouveau_maxi = np.full(nb_dim, -np.inf)
+            for bloc in histo.blocs_restants(source, tours, cle):
+                if bloc.shape[1]:
+                    id_points = histo.id_intervalles(bloc, mini, pas, xi)
+                    effectif = fusionner_comptes([effectif, compter_intervalles(id_points, xi ** nb_dim, creuse)],
+                                                 creuse)
+                    nouveau_mini = np.minimum(nouveau_mini, bloc.min(axis=1))
+                    nouveau_maxi = np.maximum(nouveau_maxi, bloc.max(axis=1))
+            if creuse:
+                densite = dict(zip(effectif[0].tolist(), (effectif[1] / histo.n).tolist()))
+                effectif = dict(zip(effectif[0].tolist(), effectif[1].tolist()))
+            else:
+                densite = (effectif / histo.n).reshape((xi,) * nb_dim, order='F')
+
+            retenus = {}
+            for id_intervalle, d, moyenne in histo.choisir_intervalles(densite, xi, mini, pas, b):
+                nb_point_to_remove = min(round((d - moyenne) * histo.n), effectif[id_intervalle])
+                histo.tot_nb_point_remove += nb_point_to_remove
+                nb_restant -= nb_point_to_remove
+                retenus[id_intervalle] = nb_point_to_remove / effectif[id_intervalle]
+            histo.fusionner_classes()
+            id_retenus = np.array(sorted(retenus), dtype=np.int64)
+            tours.append((xi, mini, pas, id_retenus, np.array([retenus[i] for i in id_retenus.tolist()])))
+            mini, maxi = nouveau_mini, nouveau_maxi
+            xi = histo.reduire_xi(xi, alpha, nb_restant, nb_dim)
+
+        # Dernière passe : classe contenant les points restants ========================================================
+        nb_restant, mini, maxi = histo.statistiques_blocs(source, tours, nb_dim, cle)
+        if nb_restant > 0:
+            histo.tab_classe.append(intervalle.Classe([(mini[d].item(), maxi[d].item()) for d in range(nb_dim)],
+                                                      densite=nb_restant / histo.n))
+        histo.fusionner_classes()
+        histo.empaqueter()
+        return histo
+
+    @classmethod
+    def blocs_restants(cls, source, tours, cle):
+        """
+        Parcours les blocs de données en retirant les points supprimés lors des tours précédents.
+        :param source: cf. depuis_blocs.
+        :param tours: Liste des (xi, mini, pas, id_retenus, proportion) des tours précédents.
+        :param cle: int, clef du tirage des points retirés (cf. tirage)
+        :return: générateur de blocs de forme (nb_dim, nb_tuple_restant_du_bloc)
+        """
+        debut = 0
+        for bloc in source():
+            bloc = np.asarray(bloc, dtype=np.float64)
+            index = np.arange(debut, debut + bloc.shape[1], dtype=np.uint64)
+            debut += bloc.shape[1]
+            for numero, (xi, mini, pas, id_retenus, proportion) in enumerate(tours):
+                if len(id_retenus) == 0:
+                    continue
+                id_points = cls.id_intervalles(bloc, mini, pas, xi)
+                # Proportion de points à retirer dans l'intervalle de chaque point (nulle hors des intervalles retenus)
+                rang = np.minimum(np.searchsorted(id_retenus, id_points), len(id_retenus) - 1)
+                a_retirer = np.where(id_retenus[rang] == id_points, proportion[rang], 0)
+                garder = tirage(index, numero, cle) >= a_retirer
+                bloc, index = bloc[:, garder], index[garder]
+            yield bloc
+
+    @classmethod
+    def statistiques_blocs(cls, source, tours, nb_dim, cle):
+        """
+        Passe sur les données renvoyant le nombre de tuple restant et leurs bornes.
+        :param source: cf. depuis_blocs.
+        :param tours: cf. blocs_restants.
+        :param nb_dim:
+        :param cle: cf. blocs_restants.
+        :return: (nb_tuple, mini, maxi)
+        """
+        nb_tuple = 0
+        mini = np.full(nb_dim, np.inf)
+        maxi = np.full(nb_dim, -np.inf)
+        for bloc in cls.blocs_restants(source, tours, cle):
+            if bloc.shape[1]:
+                nb_tuple += bloc.shape[1]
+                mini = np.minimum(mini, bloc.min(axis=1))
+                maxi = np.maximum(maxi, bloc.max(axis=1))
+        return nb_tuple, mini, maxi
 
     def print(self):
         """
@@ -193,13 +646,36 @@ class Genhist(object):
         la liste "attribut_a_estimer"
         :return: cardinalité (float)
         """
-        card = 0
-        for intervalle in self.tab_classe:
-            card += intervalle.estimate_card([self.attributes_name.index(att) for att in tab_attribut], boundary) * self.n
+        tab_dim = [self.attributes_name.index(att) for att in tab_attribut]
+        card = intervalle.estimer_zones(*self.paquet, tab_dim, [boundary])[0].item() * self.n
         if card < 0:
             raise ValueError('Cardinalité négative ...')
         return card
 
+    def estimer_batch(self, tab_attribut, zones):
+        """
+        Réalise l'estimation de cardinalité de plusieurs zones portant sur les mêmes attributs en une seule fois.
+        :param tab_attribut: Liste d'attribut (sous forme de str, doit correspondre aux noms donnés dans
+        self.attributes_name)
+        :param zones: Tableau de forme (nb_zone, len(tab_attribut), 2) des intervalles [min, max] de chaque zone.
+        :return: np.ndarray des cardinalités estimées
+        """
+        tab_dim = [self.attributes_name.index(att) for att in tab_attribut]
+        return intervalle.estimer_zones(*self.paquet, tab_dim, zones) * self.n
+
+    def empaqueter(self):
+        """
+        Rassemble les classes dans des tableaux numpy utilisés pour les estimations : bornes inférieures, bornes
+        supérieures, densité et longueur de chaque classe selon chaque dimension. Appelée une fois à la fin de la
+        construction.
+        :return: (bornes_inf, bornes_sup, densite, longueur)
+        """
+        bornes = np.array([inter.boundary for inter in self.tab_classe], dtype=np.float64)
+        bornes = bornes.reshape(len(self.tab_classe), len(self.attributes_name), 2)
+        densite = np.array([inter.densite for inter in self.tab_classe], dtype=np.float64)
+        self.paquet = (bornes[:, :, 0], bornes[:, :, 1], densite, bornes[:, :, 1] - bornes[:, :, 0])
+        return self.paquet
+
     def get_size(self):
         """
         Renvoit la taille en mémoire de l'histogramme.
@@ -208,6 +684,7 @@ class Genhist(object):
         size = 0
         for intervalle in self.tab_classe:
             size += intervalle.get_size()
+        size += sum(tableau.nbytes for tableau in self.paquet)
         size += getsizeof(self.attributes_name)
         return size
 
@@ -220,3 +697,100 @@ class Genhist(object):
         f = open(path, 'wb')
         dump(self, f)
         f.close()
+
+
+def tirage(index, tour, cle=0):
+    """
+    Tirage pseudo-aléatoire reproductible dans [0, 1) pour chaque tuple d'un tour de construction (finaliseur de
+    splitmix64 appliqué à l'index global du tuple décalé selon le tour et la clef).
+    :param index: np.ndarray d'entiers non signés sur 64 bits
+    :param tour: int
+    :param cle: int
+    :return: np.ndarray de flottants
+    """
+    z = splitmix64(index + np.uint64((cle + (tour + 1) * 0x9e3779b97f4a7c15) % 2 ** 64))
+    return (z >> np.uint64(11)).astype(np.float64) / 2.0 ** 53
+
+
+def erreur_fusion(inf_a, sup_a, densite_a, inf_b, sup_b, densite_b):
+    """
+    Erreur introduite par la fusion de la classe a avec chacune des classes b : distance L1 entre la répartition de
+    la densité avant fusion (uniforme dans chaque classe, les classes étant supposées disjointes) et après fusion
+    (uniforme dans la boîte englobante). Les dimensions selon lesquelles la boîte englobante est de largeur nulle sont
+    ignorées.
+    :param inf_a: Bornes inférieures de la classe a de forme (nb_dim,)
+    :param sup_a: Bornes supérieures de la classe a de forme (nb_dim,)
+    :param densite_a: float
+    :param inf_b: Bornes inférieures des classes b de forme (nb_classe, nb_dim)
+    :param sup_b: Bornes supérieures des classes b de forme (nb_classe, nb_dim)
+    :param densite_b: Densités des classes b de forme (nb_classe,)
+    :return: Tableau des erreurs de forme (nb_classe,)
+    """
+    inf = np.minimum(inf_a, inf_b)
+    sup = np.maximum(sup_a, sup_b)
+    utile = sup > inf
+    volume = np.where(utile, sup - inf, 1).prod(axis=1)
+    volume_a = np.where(utile, sup_a - inf_a, 1).prod(axis=1)
+    volume_b = np.where(utile, sup_b - inf_b, 1).prod(axis=1)
+    somme = densite_a + densite_b
+    return np.abs(densite_a - somme * volume_a / volume) + np.abs(densite_b - somme * volume_b / volume) + \
+        somme * np.clip(volume - volume_a - volume_b, 0, None) / volume
+
+
+def plus_denses(id_intervalle, densite, b):
+    """
+    Sélectionne les b intervalles non vides les plus denses. À densité égale, l'intervalle de plus petit identifiant
+    passe en premier, y compris pour départager les intervalles à la limite des b premiers.
+    :param id_intervalle: Identifiants des intervalles
+    :param densite: Densités des intervalles
+    :param b:
+    :return: Index (dans id_intervalle) des intervalles sélectionnés, par densité décroissante
+    """
+    nb_meilleur = min(b, len(densite))
+    if nb_meilleur == 0:
+        return np.empty(0, dtype=np.int64)
+    # Densité du b-ième intervalle : tous les intervalles au moins aussi denses sont départagés ensemble
+    seuil = -np.partition(-densite, nb_meilleur - 1)[nb_meilleur - 1]
+    candidats = np.flatnonzero((densite >= seuil) & (densite > 0))
+    return candidats[np.lexsort((id_intervalle[candidats], -densite[candidats]))[:nb_meilleur]]
+
+
+def compter_intervalles(id_intervalle, nb_intervalle, creuse):
+    """
+    Compte le nombre de points de chaque intervalle.
+    :param id_intervalle: Identifiant de l'intervalle de chaque point
+    :param nb_intervalle: Nombre d'intervalle de la grille
+    :param creuse: boolean
+    :return: Tableau des effectifs de taille nb_intervalle, ou pour une grille creuse couple (identifiants triés des
+    intervalles non vides, effectifs)
+    """
+    if creuse:
+        return np.unique(id_intervalle, return_counts=True)
+    return np.bincount(id_intervalle, minlength=nb_intervalle)
+
+
+def fusionner_comptes(comptes, creuse):
+    """
+    Somme les effectifs calculés sur plusieurs tranches de points (cf. compter_intervalles).
+    :param comptes: Liste des effectifs de chaque tranche
+    :param creuse: boolean
+    :return: Effectifs totaux
+    """
+    if not creuse:
+        return np.sum(comptes, axis=0)
+    id_non_vide, position = np.unique(np.concatenate([c[0] for c in comptes]), return_inverse=True)
+    effectif = np.bincount(position, weights=np.concatenate([c[1] for c in comptes]), minlength=len(id_non_vide))
+    return id_non_vide, effectif.astype(np.int64)
+
+
+def compter_partage(parametres):
+    """
+    Calcul de l'intervalle des points de la tranche [debut, fin[ du jeu de données partagé (écrit dans le tableau
+    partagé id_points) et de l'effectif de chaque intervalle sur cette tranche.
+    :param parametres: (debut, fin, mini, pas, xi, creuse)
+    :return: Effectifs de la tranche (cf. compter_intervalles)
+    """
+    debut, fin, mini, pas, xi, creuse = parametres
+    id_intervalle = Genhist.id_intervalles(tableaux_partages['data_set'][:, debut:fin], mini, pas, xi)
+    tableaux_partages['id_points'][debut:fin] = id_intervalle
+    return compter_intervalles(id_intervalle, xi ** len(mini), creuse)
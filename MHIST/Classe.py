@@ -2,10 +2,12 @@
 """
 :author : Cyril MOINEAU
 :creation_date : 12/02/20
-:last_change_date : 18/03/20
+:last_change_date : 18/10/26
 :description : Définition d'un intervalle_estimer pour les histogrammes MHIST.
 """
 from sys import getsizeof
+from math import ceil, floor
+import numpy as np
 
 
 class Classe(object):
@@ -17,7 +19,7 @@ class Classe(object):
         """
         self.boundaries = boundaries
         self.joint_distribution = joint_distribution
-        self.max_diff, self.max_dim = self.max_aera_diff()
+        self.max_diff, self.max_dim, self.valeur_split = self.max_aera_diff()
         self.nb_tuple = []
         self.nb_distinct_value = []
 
@@ -42,55 +44,30 @@ class Classe(object):
         marginal = [sorted(k.items(), key=lambda x: x[0]) for k in marginal]
         return marginal
 
-    def freq(self, dim, k, marginal_distribution):
+    def marginales_tableaux(self):
         """
-        Calcul de la valeur critique "frequence".
-        :param dim: dimension à étudier.
-        :param k: Index de la valeur distinct.
-        :param marginal_distribution: distribution marginale des données.
-        :return: Nombre d'apparition dans le jeu de données de la kième valeur distinct de la dim-ième dimension
+        Renvoit les distributions marginales sous forme de tableaux numpy.
+        :return: liste par dimension de couples (valeurs, frequences)
         """
-        return marginal_distribution[dim][k][1]
-
-    def spread(self, dim, k, marginal_distribution):
-        """
-        Calcul de la valeur critique "écartement".
-        :param dim: dimension à étudier.
-        :param k: Index de la valeur distinct.
-        :param marginal_distribution: distribution marginale des données.
-        :return: Différence entre la kième valeur distinct et la k+1ième valeur distinct de la dim-ième dimension
-        """
-        return marginal_distribution[dim][k + 1][0] - marginal_distribution[dim][k][0]
-
-    def aera(self, dim, k, marginal_distribution):
-        """
-        Calcul de la valeur critique "surface".
-        :param dim: dimension à étudier.
-        :param k: Index de la valeur distinct.
-        :param marginal_distribution: distribution marginale des données.
-        :return: Produit de la fréquence et de l'écartement.
-        """
-        return self.freq(dim, k, marginal_distribution) * self.spread(dim, k, marginal_distribution)
+        marginal = self.joint_to_marginal(self.joint_distribution)
+        return [(np.array([v[0] for v in m]), np.array([v[1] for v in m])) for m in marginal]
 
     def max_aera_diff(self):
         """
-        Renvoit la valeur maximal de "surface" ainsi que la dimension où l'on peut la trouver
-        :return:
+        Renvoit la valeur maximal de "surface" ainsi que la dimension où l'on peut la trouver et la valeur selon
+        laquelle couper.
+        :return: (max_diff, max_dim, valeur_split)
         """
         max_diff = 0
         max_dim = 0
-        marginal_distribution = self.joint_to_marginal(self.joint_distribution)
-
-        for nb_dim in range(len(marginal_distribution)):
-            for k in range(len(marginal_distribution[nb_dim]) - 3):
-                v = max(
-                    [abs(self.aera(nb_dim, k, marginal_distribution) - self.aera(nb_dim, k + 1, marginal_distribution)),
-                     abs(self.aera(nb_dim, k + 1, marginal_distribution) - self.aera(nb_dim, k + 2,
-                                                                                     marginal_distribution))])
-                if v > max_diff:
-                    max_diff = v
-                    max_dim = nb_dim
-        return max_diff, max_dim
+        valeur_split = None
+        for nb_dim, (valeurs, frequences) in enumerate(self.marginales_tableaux()):
+            v, split = max_diff_aire(valeurs, frequences)
+            if v > max_diff:
+                max_diff = v
+                max_dim = nb_dim
+                valeur_split = split
+        return max_diff, max_dim, valeur_split
 
     def split(self):
         """
@@ -101,8 +78,8 @@ class Classe(object):
             # Séparation de la distribution jointe =====================================================================
             joint_distribution_1 = []
             joint_distribution_2 = []
+            new_bound = self.valeur_split
             for it in self.joint_distribution:
-                new_bound = (self.boundaries[self.max_dim][0] + self.boundaries[self.max_dim][1]) / 2
                 if self.boundaries[self.max_dim][0] <= it[0][self.max_dim] < new_bound:
                     joint_distribution_1.append(it)
                 if new_bound <= it[0][self.max_dim] <= self.boundaries[self.max_dim][1]:
@@ -204,13 +181,12 @@ class Classe(object):
                 D = 1  # Estimation du nombre de valeurs distincts dans l'intervalle_estimer
                 D_i = 1  # Estimation du nombre de valeurs distincts dans l'intersection
                 for d in range(len(tab_dim)):
-                    d_i = 0
                     pas = (self.boundaries[tab_dim[d]][1]-self.boundaries[tab_dim[d]][0])/self.nb_distinct_value[tab_dim[d]]
                     frequence = self.nb_tuple / float(self.nb_distinct_value[tab_dim[d]])
-                    for id_value in range(self.nb_distinct_value[tab_dim[d]]):
-                        value = self.boundaries[tab_dim[d]][0] + id_value * pas
-                        if intervalle_a_estimer[d][0] <= value <= intervalle_a_estimer[d][1]:
-                            d_i += 1
+                    # Les valeurs distinctes sont supposées uniformément réparties : borne_inf + k * pas
+                    d_i = nb_valeurs_dans_intervalle(self.boundaries[tab_dim[d]][0], pas,
+                                                     self.nb_distinct_value[tab_dim[d]], intervalle_a_estimer[d][0],
+                                                     intervalle_a_estimer[d][1])
                     D *= self.nb_distinct_value[tab_dim[d]]
                     D_i *= d_i
                     F += frequence
@@ -231,3 +207,209 @@ class Classe(object):
         res += getsizeof(self.nb_tuple)
         res += getsizeof(self.joint_distribution)  # Devrait être 0 ...
         return res
+
+
+def nb_valeurs_dans_intervalle(borne_inf, pas, nb_valeur, mini, maxi):
+    """
+    Compte, en temps constant, les valeurs borne_inf + k * pas (0 <= k < nb_valeur) comprises dans [mini, maxi].
+    :param borne_inf:
+    :param pas:
+    :param nb_valeur:
+    :param mini:
+    :param maxi:
+    :return: int
+    """
+    if pas == 0:
+        return nb_valeur if mini <= borne_inf <= maxi else 0
+    k_min = max(0, ceil((mini - borne_inf) / pas))
+    k_max = min(nb_valeur - 1, floor((maxi - borne_inf) / pas))
+    # Correction des erreurs d'arrondi pour retrouver exactement les comparaisons valeur par valeur
+    if k_min > 0 and borne_inf + (k_min - 1) * pas >= mini:
+        k_min -= 1
+    elif k_min < nb_valeur and borne_inf + k_min * pas < mini:
+        k_min += 1
+    if k_max < nb_valeur - 1 and borne_inf + (k_max + 1) * pas <= maxi:
+        k_max += 1
+    elif k_max >= 0 and borne_inf + k_max * pas > maxi:
+        k_max -= 1
+    return max(0, k_max - k_min + 1)
+
+
+def nb_valeurs_dans_intervalle_numpy(borne_inf, pas, nb_valeur, mini, maxi):
+    """
+    Version vectorisée de "nb_valeurs_dans_intervalle", les paramètres sont des tableaux compatibles par broadcasting.
+    :return: np.ndarray
+    """
+    # Les calculs avec un pas nul produisent des valeurs invalides, elles sont remplacées à la fin
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k_min = np.maximum(0, np.ceil((mini - borne_inf) / pas))
+        k_max = np.minimum(nb_valeur - 1, np.floor((maxi - borne_inf) / pas))
+        k_min = np.where((k_min > 0) & (borne_inf + (k_min - 1) * pas >= mini), k_min - 1, k_min)
+        k_min = np.where((k_min < nb_valeur) & (borne_inf + k_min * pas < mini), k_min + 1, k_min)
+        k_max = np.where((k_max < nb_valeur - 1) & (borne_inf + (k_max + 1) * pas <= maxi), k_max + 1, k_max)
+        k_max = np.where((k_max >= 0) & (borne_inf + k_max * pas > maxi), k_max - 1, k_max)
+    nb = np.maximum(0, k_max - k_min + 1)
+    # Toutes les valeurs sont confondues lorsque le pas est nul
+    return np.where(pas == 0, np.where((mini <= borne_inf) & (borne_inf <= maxi), nb_valeur, 0), nb)
+
+
+def estimer_zones(bornes_inf, bornes_sup, nb_distinct_value, nb_tuple, tab_dim, zones, taille_bloc=2 ** 20):
+    """
+    Estimation de plusieurs zones sur un ensemble de classes en une seule fois grâce au broadcasting numpy. Le calcul
+    est identique à celui de la méthode "Classe.estimate_card" sommé sur toutes les classes.
+    :param bornes_inf: Tableau des bornes inférieures des classes de forme (nb_classe, nb_dim)
+    :param bornes_sup: Tableau des bornes supérieures des classes de forme (nb_classe, nb_dim)
+    :param nb_distinct_value: Tableau du nombre de valeurs distinctes de forme (nb_classe, nb_dim)
+    :param nb_tuple: Tableau du nombre de tuple de chaque classe de forme (nb_classe,)
+    :param tab_dim: Liste des index des dimensions des zones.
+    :param zones: Tableau des zones de forme (nb_zone, len(tab_dim), 2)
+    :param taille_bloc: Nombre maximal d'éléments des tableaux intermédiaires, les zones sont traitées par paquet.
+    :return: Tableau des cardinalités estimées de forme (nb_zone,)
+    """
+    zones = np.asarray(zones, dtype=np.float64)
+    borne_inf = bornes_inf[:, tab_dim]
+    borne_sup = bornes_sup[:, tab_dim]
+    nb_valeur = nb_distinct_value[:, tab_dim].astype(np.float64)
+    pas = (borne_sup - borne_inf) / nb_valeur
+    # F / D correspond à la fréquence estimée de chaque classe
+    frequence = (nb_tuple[:, np.newaxis] / nb_valeur).sum(axis=1) / nb_valeur.prod(axis=1)
+    resultat = np.empty(len(zones))
+    pas_bloc = max(1, taille_bloc // max(1, borne_inf.size))
+    for debut in range(0, len(zones), pas_bloc):
+        mini = zones[debut:debut + pas_bloc, np.newaxis, :, 0]
+        maxi = zones[debut:debut + pas_bloc, np.newaxis, :, 1]
+        inclus = ((mini <= borne_inf) & (borne_sup <= maxi)).all(axis=2)
+        intersection = (((borne_inf <= mini) & (mini <= borne_sup)) |
+                        ((borne_inf <= maxi) & (maxi <= borne_sup))).all(axis=2)
+        d_i = nb_valeurs_dans_intervalle_numpy(borne_inf, pas, nb_valeur, mini, maxi).prod(axis=2)
+        card = np.where(inclus, nb_tuple, np.where(intersection, frequence * d_i, 0))
+        resultat[debut:debut + pas_bloc] = card.sum(axis=1)
+    return resultat
+
+
+def max_diff_aire(valeurs, frequences):
+    """
+    Calcul vectorisé de la plus grande différence de "surface" (fréquence * écartement) entre deux valeurs distinctes
+    adjacentes d'une distribution marginale.
+    :param valeurs: Tableau trié des valeurs distinctes.
+    :param frequences: Tableau des fréquences associées.
+    :return: (max_diff, valeur_split) : la différence maximale et la valeur à partir de laquelle couper (la valeur
+    de coupe appartient à la seconde partie). (0, None) s'il y a trop peu de valeurs distinctes.
+    """
+    if len(valeurs) < 4:
+        return 0, None
+    aires = frequences[:-1] * np.diff(valeurs)
+    differences = np.abs(np.diff(aires))
+    k = int(np.argmax(differences))
+    return differences[k].item(), valeurs[k + 1].item()
+
+
+class ClasseNumpy(Classe):
+    def __init__(self, boundaries, coordonnees, effectifs, marginales=None, score=None):
+        """
+        Variante de la classe MHIST dont la distribution jointe est stockée sous forme de tableaux numpy triés.
+        Les distributions marginales sont calculées une seule fois (regroupement vectorisé) puis transmises aux classes
+        filles lors d'un split, elles ne sont jamais reconstruites à partir de dictionnaires.
+        :param boundaries:
+        :param coordonnees: Tableau trié des points distincts de forme (nb_point, nb_dim).
+        :param effectifs: Tableau du nombre d'apparition de chaque point.
+        :param marginales: Optionnel, liste par dimension de triplets (valeurs, frequences, inverse) où inverse donne
+        pour chaque point l'index de sa valeur dans valeurs. Calculée si non renseignée.
+        :param score: Optionnel, triplet (max_diff, max_dim, valeur_split) déjà calculé (par exemple par un autre
+        processus). Les distributions marginales ne sont alors calculées qu'en cas de besoin.
+        """
+        self.coordonnees = coordonnees
+        self.effectifs = effectifs
+        if marginales is None and score is None:
+            marginales = self.calcul_marginales()
+        self.marginales = marginales
+        self.score = score
+        super().__init__(boundaries, None)
+
+    def calcul_marginales(self):
+        """
+        Calcul des distributions marginales avec un regroupement vectorisé (np.unique + np.bincount).
+        :return: liste par dimension de triplets (valeurs, frequences, inverse)
+        """
+        marginales = []
+        for d in range(self.coordonnees.shape[1]):
+            valeurs, inverse = np.unique(self.coordonnees[:, d], return_inverse=True)
+            frequences = np.bincount(inverse, weights=self.effectifs).astype(self.effectifs.dtype)
+            marginales.append((valeurs, frequences, inverse))
+        return marginales
+
+    def marginales_partielles(self, masque):
+        """
+        Calcul des distributions marginales d'une partie de la classe à partir de celles de la classe.
+        Les fréquences sont recomptées avec np.bincount sur les index déjà connus, sans nouveau tri.
+        :param masque: Masque booléen des points à conserver.
+        :return: liste par dimension de triplets (valeurs, frequences, inverse)
+        """
+        effectifs = self.effectifs[masque]
+        marginales = []
+        for valeurs, _, inverse in self.marginales:
+            inverse_partiel = inverse[masque]
+            frequences = np.bincount(inverse_partiel, weights=effectifs, minlength=len(valeurs))
+            presentes = frequences > 0
+            renumerotation = np.cumsum(presentes) - 1
+            marginales.append((valeurs[presentes], frequences[presentes].astype(effectifs.dtype),
+                               renumerotation[inverse_partiel]))
+        return marginales
+
+    def marginales_tableaux(self):
+        """
+        Renvoit les distributions marginales déjà calculées.
+        :return: liste par dimension de couples (valeurs, frequences)
+        """
+        if self.marginales is None:
+            self.marginales = self.calcul_marginales()
+        return [(valeurs, frequences) for valeurs, frequences, _ in self.marginales]
+
+    def max_aera_diff(self):
+        """
+        Renvoit le score déjà connu de la classe ou le calcule.
+        :return: (max_diff, max_dim, valeur_split)
+        """
+        if self.score is not None:
+            return self.score
+        return super().max_aera_diff()
+
+    def split(self):
+        """
+        Séparation d'une classe en deux à l'aide d'un masque booléen sur les tableaux de la classe.
+        :return: Deux classes. (-1, -1) s'il n'est pas possible de séparer la classe en deux.
+        """
+        if self.max_diff == 0:
+            return -1, -1
+        # Tous les points sont compris dans les frontières de la classe
+        masque_1 = self.coordonnees[:, self.max_dim] < self.valeur_split
+        masque_2 = ~masque_1
+        if not masque_1.any() or not masque_2.any():
+            return -1, -1
+        if self.marginales is None:
+            self.marginales = self.calcul_marginales()
+        marginales_1 = self.marginales_partielles(masque_1)
+        marginales_2 = self.marginales_partielles(masque_2)
+        # Les valeurs distinctes sont triées, les nouvelles frontières sont donc directement connues
+        boundaries_1 = list(self.boundaries)
+        boundaries_2 = list(self.boundaries)
+        valeurs_1 = marginales_1[self.max_dim][0]
+        valeurs_2 = marginales_2[self.max_dim][0]
+        boundaries_1[self.max_dim] = (valeurs_1[0].item(), valeurs_1[-1].item())
+        boundaries_2[self.max_dim] = (valeurs_2[0].item(), valeurs_2[-1].item())
+        intervalle_1 = ClasseNumpy(boundaries_1, self.coordonnees[masque_1], self.effectifs[masque_1], marginales_1)
+        intervalle_2 = ClasseNumpy(boundaries_2, self.coordonnees[masque_2], self.effectifs[masque_2], marginales_2)
+        return intervalle_1, intervalle_2
+
+    def freeze(self):
+        """
+        Enlève de la mémoire la distribution jointe et les distributions marginales.
+        :return:
+        """
+        self.nb_tuple = int(self.effectifs.sum())
+        self.nb_distinct_value = [len(valeurs) for valeurs, _ in self.marginales_tableaux()]
+        self.coordonnees = None
+        self.effectifs = None
+        self.marginales = None
+        self.score = None
+        self.joint_distribution = None
@@ -3,26 +3,45 @@
 """
 :author : Cyril MOINEAU
 :creation_date : 12/02/20
-:last_change_date : 18/02/20
+:last_change_date : 18/10/26
 :description : Définition d'un histogramme MHIST.
 """
 # from matplotlib import patches
 # import matplotlib.pyplot as plt
 from MHIST import Classe
+from index import Index
+from partage import MemoirePartagee, attacher_memoire, tableaux_partages, splitmix64, verifier_memoire_partagee
 from collections import Counter
+from heapq import heappush, heappop
+from itertools import count
+from concurrent.futures import ProcessPoolExecutor
 from sys import getsizeof
 from pickle import dump
+import numpy as np
 
 
 class Mhist(object):
-    def __init__(self, data, attributes_name, nb_max_intervalle, verbeux=False):
+    def __init__(self, data, attributes_name, nb_max_intervalle, verbeux=False, index=False, nb_processus=None,
+                 nb_split_par_tour=1):
         """
         Initialisation d'un histogramme
-        :param data: list[list] Les données que doit estimer l'histogramme.
+        :param data: list[list] Les données que doit estimer l'histogramme. Il est aussi possible de donner un tableau
+        numpy 2-D de forme (nb_dim, nb_tuple) ou une liste de colonnes numpy, la distribution jointe est alors calculée
+        de manière vectorisée et conservée sous forme de tableaux.
         :param attributes_name: list[string] Noms donné aux attributs. Utile pour l'estimation.
         :param nb_max_intervalle: int: Définis le nombre maximum d'intervalle.
         :param verbeux: boolean: permet l'affichage de certain print.
+        :param index: boolean: Optionnel, construit un index des frontières des classes à la fin de la construction pour
+        ne visiter que les classes intersectant la zone lors des estimations.
+        :param nb_processus: int: Optionnel, nombre de processus utilisés pour séparer les intervalles en parallèle
+        (les données sont alors traitées sous forme de colonnes numpy). Nécessite Python 3.8 ou plus.
+        :param nb_split_par_tour: int: Nombre d'intervalles les plus critiques séparés à chaque tour lors d'une
+        construction parallèle. Avec 1, le résultat est identique à la construction séquentielle.
         """
+        if nb_processus is not None:
+            verifier_memoire_partagee()
+            if not est_en_colonnes(data):
+                data = np.asarray(data)
         # On test les entrées ==========================================================================================
         nb_dim = len(data)
         nb_tuple = len(data[0])
@@ -32,65 +51,246 @@ class Mhist(object):
         if nb_dim != len(attributes_name):
             raise ValueError('ERREUR : Vous devez nommer tous les attributs !')
 
-        # Pour l'affichage
-        self.min_max = [(min(a), max(a)) for a in data]
-
-        # Création de la distribution jointe ===========================================================================
-        tableau_de_coordonee = []
-        for i in range(nb_tuple):
-            coordonnee = []
-            for j in range(nb_dim):
-                coordonnee.append(data[j][i])
-            tableau_de_coordonee.append(tuple(coordonnee))
-        joint_distribution = Counter(tableau_de_coordonee)
-        joint_distribution = sorted(joint_distribution.items(), key=lambda t: t[0])
+        # Création de la distribution jointe et du premier intervalle ==================================================
+        if est_en_colonnes(data):
+            # Pour l'affichage
+            self.min_max = [(d.min().item(), d.max().item()) for d in data]
+            coordonnees, effectifs = distribution_jointe_numpy(data)
+            fi = Classe.ClasseNumpy(list(self.min_max), coordonnees, effectifs)
+        else:
+            # Pour l'affichage
+            self.min_max = [(min(a), max(a)) for a in data]
+            tableau_de_coordonee = []
+            for i in range(nb_tuple):
+                coordonnee = []
+                for j in range(nb_dim):
+                    coordonnee.append(data[j][i])
+                tableau_de_coordonee.append(tuple(coordonnee))
+            joint_distribution = Counter(tableau_de_coordonee)
+            joint_distribution = sorted(joint_distribution.items(), key=lambda t: t[0])
+            fi = Classe.Classe(list(self.min_max), joint_distribution)
 
         # Initialisation des attributs =================================================================================
-        # Création du premier intervalle
-        fi = Classe.Classe([(min(data[j]), max(data[j])) for j in range(nb_dim)], joint_distribution)
         self.verbeux = verbeux
         self.tab_classe = []
         self.tab_classe.append(fi)
         self.nb_max_intervalle = nb_max_intervalle
         self.attributes_name = attributes_name
+        self.avec_index = index
+        self.index = None
+        self.paquet = None  # Tableaux des classes une fois l'histogramme compacté (cf. méthode compact)
+        self.nb_processus = nb_processus
+        self.nb_split_par_tour = nb_split_par_tour
         # On lance l'algorithme qui va séparer successivement le premier intervalle
-        self.build()
-
-    def trouver_intervalle_critique(self):
-        """
-        Renvoit l'index de l'intervalle qui a le plus besoin d'être partitionné.
-        :return: int: index
-        """
-        max_diff = 0
-        max_intervalle = 0
-        for intervalle_id in range(len(self.tab_classe)):
-            if self.tab_classe[intervalle_id].max_diff > max_diff:
-                max_intervalle = intervalle_id
-                max_diff = self.tab_classe[intervalle_id].max_diff
-        return max_intervalle
+        if nb_processus is None:
+            self.build()
+        else:
+            self.build_parallele()
 
     def build(self):
         """
         Fonction qui va séparer successivement le premier intervalle selon les dimensions critiques.
+        Les intervalles sont rangés dans un tas-max selon leur max_diff, l'intervalle critique est donc obtenu en
+        O(log n) au lieu d'un parcours de self.tab_classe.
         :return: None
         """
-        impossible_de_split = False
-        while len(self.tab_classe) < self.nb_max_intervalle and not impossible_de_split:
+        # Le tas contient des triplets (-max_diff, ordre d'insertion, intervalle). L'ordre d'insertion départage les
+        # égalités comme le faisait le parcours linéaire de la liste (premier intervalle rencontré). Il sert aussi
+        # d'identifiant de noeud dans l'arbre des coupes.
+        ordre = count()
+        coupes = []
+        tas = []
+        for it in self.tab_classe:
+            heappush(tas, (-it.max_diff, next(ordre), it))
+        while len(tas) < self.nb_max_intervalle:
             if self.verbeux:
-                print('Avancement de la construction : ' + str(len(self.tab_classe)) + '/' + str(self.nb_max_intervalle))
-            index_intervalle_crit = self.trouver_intervalle_critique()
-            it1, it2 = self.tab_classe[index_intervalle_crit].split()
+                print('Avancement de la construction : ' + str(len(tas)) + '/' + str(self.nb_max_intervalle))
+            entree = heappop(tas)
+            it1, it2 = entree[2].split()
             if (it1, it2) != (-1, -1):
-                # On retire l'ancien intervalle et on le remplace par les deux nouveaux.
-                del self.tab_classe[index_intervalle_crit]
-                self.tab_classe.append(it1)
-                self.tab_classe.append(it2)
+                # L'ancien intervalle sorti du tas est remplacé par les deux nouveaux.
+                gauche, droite = next(ordre), next(ordre)
+                coupes.append((entree[1], entree[2].max_dim, entree[2].valeur_split, gauche, droite))
+                heappush(tas, (-it1.max_diff, gauche, it1))
+                heappush(tas, (-it2.max_diff, droite, it2))
             else:
                 # On arrive ici si l'on dépasse le nombre de valeur distinct avec le nombre d'intervalle
-                impossible_de_split = True
+                heappush(tas, entree)
+                break
+        self.terminer_build(tas, coupes)
+
+    def build_parallele(self):
+        """
+        Construction parallèle : à chaque tour, les nb_split_par_tour intervalles les plus critiques sont séparés par un
+        ProcessPoolExecutor. La distribution jointe est placée en mémoire partagée, chaque intervalle correspond à une
+        tranche contiguë de ces tableaux que le processus réordonne sur place, seules les frontières et les scores
+        transitent entre les processus. Les résultats sont appliqués dans l'ordre du tas, la construction est donc
+        déterministe.
+        :return: None
+        """
+        racine = self.tab_classe[0]
+        memoire = MemoirePartagee([('coordonnees', racine.coordonnees.shape, racine.coordonnees.dtype),
+                                   ('effectifs', racine.effectifs.shape, racine.effectifs.dtype)])
+        with memoire as tableaux:
+            coordonnees, effectifs = tableaux['coordonnees'], tableaux['effectifs']
+            coordonnees[:] = racine.coordonnees
+            effectifs[:] = racine.effectifs
+            racine.coordonnees = coordonnees
+            racine.effectifs = effectifs
+            del tableaux
+
+            # Le tas contient des quintuplets (-max_diff, ordre d'insertion, intervalle, début, fin) où [début, fin[
+            # est la tranche des tableaux partagés correspondant à l'intervalle.
+            ordre = count()
+            coupes = []
+            tas = [(-racine.max_diff, next(ordre), racine, 0, len(effectifs))]
+            with ProcessPoolExecutor(max_workers=self.nb_processus, initializer=attacher_memoire,
+                                     initargs=(memoire.description,)) as executeur:
+                while len(tas) < self.nb_max_intervalle:
+                    if self.verbeux:
+                        print('Avancement de la construction : ' + str(len(tas)) + '/' + str(self.nb_max_intervalle))
+                    lot = []
+                    nb_split = min(self.nb_split_par_tour, self.nb_max_intervalle - len(tas))
+                    while tas and len(lot) < nb_split and tas[0][2].max_diff != 0:
+                        lot.append(heappop(tas))
+                    if not lot:
+                        # Plus aucun intervalle ne peut être séparé
+                        break
+                    resultats = executeur.map(split_partage, [(e[3], e[4], e[2].boundaries, e[2].max_dim,
+                                                               e[2].valeur_split) for e in lot])
+                    for entree, (milieu, enfants) in zip(lot, resultats):
+                        debut, fin = entree[3], entree[4]
+                        noeuds = next(ordre), next(ordre)
+                        coupes.append((entree[1], entree[2].max_dim, entree[2].valeur_split) + noeuds)
+                        for (bornes, score), (a, b), noeud in zip(enfants, ((debut, debut + milieu),
+                                                                            (debut + milieu, fin)), noeuds):
+                            it = Classe.ClasseNumpy(bornes, coordonnees[a:b], effectifs[a:b], score=score)
+                            heappush(tas, (-it.max_diff, noeud, it, a, b))
+                    del lot, resultats, entree
+            racine = None
+            self.terminer_build(tas, coupes)
+            del tas, coordonnees, effectifs
+
+    def terminer_build(self, tas, coupes):
+        """
+        Range les intervalles du tas dans self.tab_classe selon leur ordre de création puis les fige. L'arbre des coupes
+        est conservé sous forme de tableaux dans self.arbre (cf. méthode classe_des_points).
+        :param tas: Liste dont les éléments sont de la forme (-max_diff, ordre d'insertion, intervalle, ...)
+        :param coupes: Liste des coupes (noeud, dimension, valeur, noeud gauche, noeud droit) réalisées
+        :return: None
+        """
+        tas = sorted(tas, key=lambda e: e[1])
+        self.tab_classe = [entree[2] for entree in tas]
+        nb_noeud = 1 + 2 * len(coupes)
+        dims = np.full(nb_noeud, -1, dtype=np.int64)
+        valeurs = np.zeros(nb_noeud, dtype=np.float64)
+        gauche = np.zeros(nb_noeud, dtype=np.int64)
+        droite = np.zeros(nb_noeud, dtype=np.int64)
+        feuille = np.full(nb_noeud, -1, dtype=np.int64)
+        for noeud, dim, valeur, g, d in coupes:
+            dims[noeud], valeurs[noeud], gauche[noeud], droite[noeud] = dim, valeur, g, d
+        feuille[[entree[1] for entree in tas]] = np.arange(len(tas))
+        self.arbre = (dims, valeurs, gauche, droite, feuille)
         for it in self.tab_classe:
             # Une fois que l'on à terminé, je supprime les distributions marginale des intervalles.
             it.freeze()
+        if self.avec_index:
+            self.index = Index.depuis_classes(self.tab_classe)
+
+    def classe_des_points(self, points):
+        """
+        Renvoit, pour chaque point, l'index (dans self.tab_classe ou dans les tableaux compactés) de la classe où il
+        tombe en suivant les coupes successives de la construction. Les coupes partitionnent tout l'espace, un point
+        en dehors des frontières des classes est donc rattaché à la classe la plus proche selon les coupes.
+        :param points: Tableau de forme (nb_dim, nb_point)
+        :return: np.ndarray d'index
+        """
+        dims, valeurs, gauche, droite, feuille = self.arbre
+        points = np.asarray(points)
+        noeud = np.zeros(points.shape[1], dtype=np.int64)
+        actifs = np.flatnonzero(dims[noeud] >= 0)
+        while len(actifs):
+            n = noeud[actifs]
+            a_gauche = points[dims[n], actifs] < valeurs[n]
+            noeud[actifs] = np.where(a_gauche, gauche[n], droite[n])
+            actifs = actifs[dims[noeud[actifs]] >= 0]
+        return feuille[noeud]
+
+    @classmethod
+    def depuis_echantillon(cls, source, attributes_name, nb_max_intervalle, taille_echantillon, graine=None,
+                           taille_esquisse=256, verbeux=False, index=False):
+        """
+        Construction approchée pour des jeux de données trop volumineux pour la mémoire. Une première passe sur les
+        données tire un échantillon uniforme (réservoir) de taille_echantillon tuples, l'histogramme est construit sur
+        cet échantillon. Une seconde passe recompte ensuite, pour chaque classe finale, le nombre de tuple et le nombre
+        de valeurs distinctes (estimé avec une esquisse des k plus petites empreintes). Les frontières sont celles des
+        découpages faits sur l'échantillon, elles ne sont élargies que pour contenir les tuples hors échantillon qui
+        tombent en dehors : si l'échantillon est le jeu de données entier, on retrouve les classes de build.
+        La mémoire utilisée est bornée par la taille de l'échantillon et le nombre de classes.
+        :param source: Fonction sans paramètre renvoyant un itérable de blocs de données, chaque bloc étant un tableau
+        de forme (nb_dim, nb_tuple_du_bloc). Elle est appelée une fois par passe.
+        :param attributes_name: list[string] Noms donné aux attributs.
+        :param nb_max_intervalle: int: Définis le nombre maximum d'intervalle.
+        :param taille_echantillon: int: Nombre de tuple de l'échantillon.
+        :param graine: Optionnel, graine du générateur aléatoire numpy.
+        :param taille_esquisse: int: Nombre d'empreintes conservées par classe et par dimension pour estimer le nombre
+        de valeurs distinctes (le compte est exact en dessous de ce nombre).
+        :param verbeux: boolean: permet l'affichage de certain print.
+        :param index: boolean: cf. constructeur.
+        :return: Mhist
+        """
+        rng = np.random.default_rng(graine)
+        # Première passe : échantillonnage par réservoir ===============================================================
+        # Chaque tuple reçoit une clef aléatoire, on conserve les tuples de plus petites clefs.
+        echantillon = None
+        cles = None
+        mini = np.full(len(attributes_name), np.inf)
+        maxi = np.full(len(attributes_name), -np.inf)
+        for bloc in source():
+            bloc = np.asarray(bloc)
+            if echantillon is None:
+                echantillon, cles = bloc[:, :0], np.empty(0)
+            if bloc.shape[1]:
+                mini, maxi = np.minimum(mini, bloc.min(axis=1)), np.maximum(maxi, bloc.max(axis=1))
+            echantillon = np.concatenate([echantillon, bloc], axis=1)
+            cles = np.concatenate([cles, rng.random(bloc.shape[1])])
+            if len(cles) > taille_echantillon:
+                garder = np.argpartition(cles, taille_echantillon)[:taille_echantillon]
+                echantillon, cles = echantillon[:, garder], cles[garder]
+        if verbeux:
+            print('Échantillon de', echantillon.shape[1], 'tuples, construction de l\'histogramme')
+        histo = cls(echantillon, attributes_name, nb_max_intervalle, verbeux=verbeux)
+        histo.min_max = [(mini[d].item(), maxi[d].item()) for d in range(len(mini))]
+        del echantillon, cles
+
+        # Seconde passe : recomptage sur l'ensemble des données ========================================================
+        nb_classe = len(histo.tab_classe)
+        nb_dim = len(attributes_name)
+        nb_tuple = np.zeros(nb_classe, dtype=np.int64)
+        bornes_inf = np.full((nb_classe, nb_dim), np.inf)
+        bornes_sup = np.full((nb_classe, nb_dim), -np.inf)
+        esquisses = [None] * nb_dim
+        for bloc in source():
+            bloc = np.asarray(bloc)
+            id_classe = histo.classe_des_points(bloc)
+            nb_tuple += np.bincount(id_classe, minlength=nb_classe)
+            np.minimum.at(bornes_inf, id_classe, bloc.T)
+            np.maximum.at(bornes_sup, id_classe, bloc.T)
+            for d in range(nb_dim):
+                esquisses[d] = fusion_esquisse(esquisses[d], id_classe, empreinte(bloc[d]), taille_esquisse)
+        nb_distinct_value = np.ones((nb_classe, nb_dim), dtype=np.int64)
+        for d in range(nb_dim):
+            nb_distinct_value[:, d] = estimation_distinct(esquisses[d], nb_classe, taille_esquisse)
+        for i, it in enumerate(histo.tab_classe):
+            if nb_tuple[i]:
+                it.boundaries = [(min(b[0], bornes_inf[i, d].item()), max(b[1], bornes_sup[i, d].item()))
+                                 for d, b in enumerate(it.boundaries)]
+            it.nb_tuple = int(nb_tuple[i])
+            it.nb_distinct_value = nb_distinct_value[i].tolist()
+        histo.avec_index = index
+        if index:
+            histo.index = Index.depuis_classes(histo.tab_classe)
+        return histo
 
     def print(self):
         """
@@ -111,9 +311,10 @@ class Mhist(object):
         axes.set_xlabel(dim_names[0])
         axes.set_ylabel(dim_names[1])
         subplot = figure.add_subplot(111, sharex=axes, sharey=axes)
-        for i in self.tab_classe:
-            bound, w, h = i.print([self.attributes_name.index(dim_names[0]), self.attributes_name.index(dim_names[1])])
-            subplot.add_patch(patches.Rectangle(bound, w, h, linewidth=1, fill=False))
+        bornes_inf, bornes_sup, _, _ = self.empaqueter()
+        dims = [self.attributes_name.index(dim_names[0]), self.attributes_name.index(dim_names[1])]
+        for inf, sup in zip(bornes_inf[:, dims], bornes_sup[:, dims]):
+            subplot.add_patch(patches.Rectangle(tuple(inf), sup[0] - inf[0], sup[1] - inf[1], linewidth=1, fill=False))
         plt.show()
 
     def estimer(self, attributs_a_estimer, intervalle_a_estimer):
@@ -125,12 +326,61 @@ class Mhist(object):
         la liste "attribut_a_estimer"
         :return: cardinalité (float)
         """
+        tab_dim = [self.attributes_name.index(att) for att in attributs_a_estimer]
+        if self.paquet is not None:
+            # Histogramme compacté, l'estimation se fait directement sur les tableaux
+            paquet = self.paquet
+            if self.index is not None:
+                candidats = self.index.candidats(tab_dim, intervalle_a_estimer)
+                paquet = [tableau[candidats] for tableau in paquet]
+            return Classe.estimer_zones(*paquet, tab_dim, [intervalle_a_estimer])[0].item()
+        if self.index is None:
+            tab_classe = self.tab_classe
+        else:
+            tab_classe = [self.tab_classe[i] for i in self.index.candidats(tab_dim, intervalle_a_estimer)]
         card = 0
-        for intervalle in self.tab_classe:
-            card += intervalle.estimate_card([self.attributes_name.index(att) for att in attributs_a_estimer],
-                                             intervalle_a_estimer)
+        for intervalle in tab_classe:
+            card += intervalle.estimate_card(tab_dim, intervalle_a_estimer)
         return card
 
+    def estimer_batch(self, attributs_a_estimer, zones):
+        """
+        Réalise l'estimation de cardinalité de plusieurs zones portant sur les mêmes attributs en une seule fois.
+        :param attributs_a_estimer: Liste d'attribut (sous forme de str, doit correspondre aux noms donnés dans
+        self.attributes_name)
+        :param zones: Tableau de forme (nb_zone, len(attributs_a_estimer), 2) des intervalles [min, max] de chaque zone.
+        :return: np.ndarray des cardinalités estimées
+        """
+        tab_dim = [self.attributes_name.index(att) for att in attributs_a_estimer]
+        bornes_inf, bornes_sup, nb_distinct_value, nb_tuple = self.empaqueter()
+        return Classe.estimer_zones(bornes_inf, bornes_sup, nb_distinct_value, nb_tuple, tab_dim, zones)
+
+    def empaqueter(self):
+        """
+        Rassemble les informations des classes dans des tableaux numpy.
+        :return: (bornes_inf, bornes_sup, nb_distinct_value, nb_tuple) de formes (nb_classe, nb_dim) et (nb_classe,)
+        """
+        if self.paquet is not None:
+            return self.paquet
+        bornes = np.array([c.boundaries for c in self.tab_classe], dtype=np.float64)
+        nb_distinct_value = np.array([c.nb_distinct_value for c in self.tab_classe], dtype=np.int64)
+        nb_tuple = np.array([c.nb_tuple for c in self.tab_classe], dtype=np.int64)
+        return bornes[:, :, 0], bornes[:, :, 1], nb_distinct_value, nb_tuple
+
+    def compact(self):
+        """
+        Remplace les objets classes par des tableaux numpy contigus : bornes inférieures, bornes supérieures, nombre de
+        valeurs distinctes par dimension et nombre de tuple. Les estimations se font ensuite directement sur ces
+        tableaux, la liste self.tab_classe n'est plus disponible.
+        :return: None
+        """
+        if self.paquet is None:
+            self.paquet = self.empaqueter()
+            self.tab_classe = None
+            if self.index is not None:
+                # L'index partage les tableaux de bornes
+                self.index = Index(self.paquet[0], self.paquet[1])
+
     def get_size(self):
         """
         Renvoit l'espace de stockage necessaire pour l'histogramme.
@@ -138,9 +388,15 @@ class Mhist(object):
         """
         size = 0
         size += getsizeof(self.nb_max_intervalle)
-        for intervalle in self.tab_classe:
-            size += intervalle.get_size()
+        if self.paquet is not None:
+            size += sum(tableau.nbytes for tableau in self.paquet)
+        else:
+            for intervalle in self.tab_classe:
+                size += intervalle.get_size()
         size += getsizeof(self.attributes_name)
+        if self.index is not None:
+            size += self.index.get_size(avec_bornes=self.paquet is None)
+        size += sum(tableau.nbytes for tableau in self.arbre)
         return size
 
     def save(self, path):
@@ -152,3 +408,105 @@ class Mhist(object):
         f = open(path, 'wb')
         dump(self, f)
         f.close()
+
+
+def split_partage(parametres):
+    """
+    Séparation d'un intervalle dont la distribution jointe est la tranche [debut, fin[ des tableaux partagés. La tranche
+    est réordonnée sur place (partition stable, les deux parties restent triées) puis les deux nouveaux intervalles
+    sont évalués.
+    :param parametres: (debut, fin, boundaries, max_dim, valeur_split)
+    :return: (milieu, [(frontières, score) pour chacune des deux parties]) où milieu est la taille de la première partie
+    """
+    debut, fin, boundaries, max_dim, valeur_split = parametres
+    coordonnees = tableaux_partages['coordonnees'][debut:fin]
+    effectifs = tableaux_partages['effectifs'][debut:fin]
+    masque = coordonnees[:, max_dim] < valeur_split
+    ordre = np.argsort(~masque, kind='stable')
+    coordonnees[:] = coordonnees[ordre]
+    effectifs[:] = effectifs[ordre]
+    milieu = int(masque.sum())
+    enfants = []
+    for a, b in ((0, milieu), (milieu, fin - debut)):
+        it = Classe.ClasseNumpy(None, coordonnees[a:b], effectifs[a:b])
+        valeurs = it.marginales[max_dim][0]
+        bornes = list(boundaries)
+        bornes[max_dim] = (valeurs[0].item(), valeurs[-1].item())
+        enfants.append((bornes, (it.max_diff, it.max_dim, it.valeur_split)))
+    return milieu, enfants
+
+
+def empreinte(valeurs):
+    """
+    Calcul d'une empreinte pseudo-aléatoire sur 64 bits de chaque valeur (finaliseur de splitmix64 appliqué à la
+    représentation binaire du flottant).
+    :param valeurs: np.ndarray
+    :return: np.ndarray d'entiers non signés sur 64 bits
+    """
+    # + 0.0 pour que -0.0 et 0.0 aient la même empreinte
+    return splitmix64((np.asarray(valeurs, dtype=np.float64) + 0.0).view(np.uint64))
+
+
+def fusion_esquisse(esquisse, id_classe, empreintes, taille_esquisse):
+    """
+    Ajoute des empreintes aux esquisses des classes : pour chaque classe on ne conserve que les taille_esquisse plus
+    petites empreintes distinctes.
+    :param esquisse: None ou couple (id_classe, empreintes) trié selon la classe puis l'empreinte.
+    :param id_classe: Classe de chaque nouvelle empreinte.
+    :param empreintes: Nouvelles empreintes.
+    :param taille_esquisse:
+    :return: couple (id_classe, empreintes)
+    """
+    if esquisse is not None:
+        id_classe = np.concatenate([esquisse[0], id_classe])
+        empreintes = np.concatenate([esquisse[1], empreintes])
+    ordre = np.lexsort((empreintes, id_classe))
+    id_classe, empreintes = id_classe[ordre], empreintes[ordre]
+    nouveau = np.ones(len(ordre), dtype=bool)
+    nouveau[1:] = (id_classe[1:] != id_classe[:-1]) | (empreintes[1:] != empreintes[:-1])
+    id_classe, empreintes = id_classe[nouveau], empreintes[nouveau]
+    # Rang de chaque empreinte au sein de sa classe
+    debut_classe = np.flatnonzero(np.r_[True, id_classe[1:] != id_classe[:-1]])
+    rang = np.arange(len(id_classe)) - np.repeat(debut_classe, np.diff(np.r_[debut_classe, len(id_classe)]))
+    garder = rang < taille_esquisse
+    return id_classe[garder], empreintes[garder]
+
+
+def estimation_distinct(esquisse, nb_classe, taille_esquisse):
+    """
+    Estime le nombre de valeurs distinctes de chaque classe à partir de son esquisse. Si la classe possède moins de
+    taille_esquisse empreintes le compte est exact, sinon on utilise l'estimateur (k - 1) / h_k où h_k est la k-ième
+    plus petite empreinte ramenée dans [0, 1].
+    :param esquisse: couple (id_classe, empreintes) trié.
+    :param nb_classe:
+    :param taille_esquisse:
+    :return: np.ndarray du nombre de valeurs distinctes (au moins 1) de chaque classe
+    """
+    id_classe, empreintes = esquisse
+    nb = np.bincount(id_classe, minlength=nb_classe)
+    estimation = nb.astype(np.float64)
+    pleines = np.flatnonzero(nb >= taille_esquisse)
+    if len(pleines):
+        fin = np.cumsum(nb)[pleines] - 1
+        estimation[pleines] = (taille_esquisse - 1) / (empreintes[fin].astype(np.float64) / 2.0 ** 64)
+    return np.maximum(1, np.round(estimation)).astype(np.int64)
+
+
+def est_en_colonnes(data):
+    """
+    Indique si les données sont fournies sous forme de colonnes numpy (tableau 2-D ou liste de tableaux).
+    :param data:
+    :return: boolean
+    """
+    return isinstance(data, np.ndarray) or all(isinstance(d, np.ndarray) for d in data)
+
+
+def distribution_jointe_numpy(data):
+    """
+    Calcul vectorisé de la distribution jointe à partir de colonnes numpy.
+    :param data: Tableau 2-D de forme (nb_dim, nb_tuple) ou liste de colonnes numpy.
+    :return: (coordonnees, effectifs) : les points distincts triés de forme (nb_point, nb_dim) et leur nombre
+    d'apparition.
+    """
+    coordonnees, effectifs = np.unique(np.column_stack(data), axis=0, return_counts=True)
+    return coordonnees, effectifs
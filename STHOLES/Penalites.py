@@ -0,0 +1,70 @@
+# -*- coding: UTF-8 -*-
+"""
+:author : Cyril MOINEAU
+:creation_date : 18/10/26
+:last_change_date : 18/10/26
+:description : Table des pénalités de fusion d'un histogramme ST-Holes, doublée d'un tas pour trouver la fusion la moins
+coûteuse sans parcourir toute la table.
+"""
+from heapq import heappush, heappop, heapify
+from itertools import count
+
+
+class Penalites(dict):
+    def __init__(self, elements=()):
+        """
+        Dictionnaire clef = classe, valeur = [classe_meilleur_fusion, penalité]. Chaque affectation ajoute une entrée au
+        tas, les entrées périmées (classe supprimée ou pénalité recalculée) sont ignorées au moment de lire le minimum.
+        À pénalité égale, le tas rend la classe insérée en premier dans le dictionnaire, comme le ferait un parcours.
+        :param elements: Liste de couple (clef, valeur) à insérer.
+        """
+        super().__init__()
+        self.tas = []
+        self.rang = {}  # clef -> rang d'insertion dans le dictionnaire (inchangé si la clef est réaffectée)
+        self.version = {}  # clef -> numéro de la dernière entrée ajoutée au tas
+        self.compteur = count()
+        for clef, valeur in elements:
+            self[clef] = valeur
+
+    def __setitem__(self, clef, valeur):
+        numero = next(self.compteur)
+        if clef not in self.rang:
+            self.rang[clef] = numero
+        self.version[clef] = numero
+        super().__setitem__(clef, valeur)
+        heappush(self.tas, (valeur[1], self.rang[clef], numero, clef))
+        if len(self.tas) > 2 * len(self) + 64:
+            self.compacter()
+
+    def __delitem__(self, clef):
+        super().__delitem__(clef)
+        del self.rang[clef]
+        del self.version[clef]
+
+    def __reduce__(self):
+        # Les valeurs référencent des classes qui référencent la table : on ne réinsère qu'une fois tout désérialisé.
+        return self.__class__, (), list(self.items())
+
+    def __setstate__(self, elements):
+        for clef, valeur in elements:
+            self[clef] = valeur
+
+    def compacter(self):
+        """
+        Reconstruit le tas en ne gardant que les entrées à jour.
+        :return:
+        """
+        self.tas = [entree for entree in self.tas if self.version.get(entree[3]) == entree[2]]
+        heapify(self.tas)
+
+    def minimum(self):
+        """
+        Renvoit la classe dont la fusion est la moins coûteuse, sans la retirer de la table.
+        :return: (classe, [classe_meilleur_fusion, penalité])
+        """
+        while self.tas:
+            penalite, _, numero, clef = self.tas[0]
+            if self.version.get(clef) == numero:
+                return clef, self[clef]
+            heappop(self.tas)
+        raise KeyError("Aucune pénalité")
@@ -2,7 +2,7 @@
 """
 :author : Cyril MOINEAU
 :creation_date : 02/03/20
-:last_change_date : 11/06/20
+:last_change_date : 18/10/26
 :description : Définition d'un histogramme ST-Holes.
 
 Définitions :
@@ -14,13 +14,19 @@ Définitions :
 from sys import getsizeof
 from copy import deepcopy, copy
 from utils import epsilon
+from STHOLES.Penalites import Penalites
+from index import Index
 from pickle import dump
+from heapq import nsmallest
+import numpy as np
 # import matplotlib.pyplot as plt
 # from matplotlib import patches
 
+seuil_index = 32  # Nombre de fils à partir duquel une classe indexe les frontières de ses fils (cf. fils_candidats)
+
 
 class Stholes(object):
-    def __init__(self, attributes_name, nb_max_bucket, verbeux=False):
+    def __init__(self, attributes_name, nb_max_bucket, verbeux=False, nb_voisins=None):
         """
         Un histogramme ST-Holes est un histogramme qui peut se définir comme un arbre. Une classe correspond à un
         histogramme St-Holes. On retrouve des notions tel que celle d'boundary (i.e: noeud) fils ou père.
@@ -30,6 +36,7 @@ class Stholes(object):
         :param attributes_name:
         :param nb_max_bucket:
         :param verbeux:
+        :param nb_voisins: Nombre de frères (les plus proches) avec lesquels on évalue une fusion ss, tous si None.
         """
         self.nb_tuple = 0  # Nombre de tuple inclus dans la classe
         self.children = []  # Liste des enfants (classe inclus dans la classe courante)
@@ -40,8 +47,15 @@ class Stholes(object):
         self.howasicreated = None  # Seulement pour débugger, permet de savoir comment à été crée la classe
                                    # 0 : Fusion ss, 1 : Fusion pc, 2 : Drill
         self.verbeux = verbeux
-        self.penalities= {}  # Dictionnaire clef = classe
-                             #              valeur = [classe_meilleur_fusion, penalité]
+        self.nb_voisins = nb_voisins
+        # Volumes mis en cache (cf. vBox et v), à invalider dès que intervalles ou children changent
+        self.volume_boite = None
+        self.volume_fils = None
+        self.volume_projete = {}  # Volume projeté sur un tuple de dimensions, une fois retiré celui des fils (cf. estimer)
+        self.index_fils = None  # Index des frontières des fils (cf. fils_candidats)
+        self.nb_classe = 1  # Nombre de classe de l'histogramme, n'est tenu à jour que sur la racine
+        self.penalities= Penalites()  # Dictionnaire clef = classe
+                                      #              valeur = [classe_meilleur_fusion, penalité]
         # Note : Le tableau des pénalités ne teste que la classe père et les classes "soeur", on ne test pas les fils
         # car ils testent leur père ce qui suffit grâce à la symétrie de la fusion.
 
@@ -79,18 +93,9 @@ class Stholes(object):
         permet de perdre le moins d'information possible !
         :return:
         """
-        # Recherche de la plus faible pénalité =========================================================================
-        # INITIALISATION
-        min_p = None
-        b1 = None
-        b2 = None
+        # Recherche de la plus faible pénalité (cf. Penalites.minimum) ==================================================
         fusion_pc = False
-        # DEBUT
-        for key, value in self.penalities.items():
-            if min_p is None or value[1] < min_p:
-                min_p = value[1]
-                b1 = key
-                b2 = value[0]
+        b1, (b2, _) = self.penalities.minimum()
         # CAS FUSION PC
         if b1.father is b2:  # Cas où b2 est le père de b1
             fusion_pc = True
@@ -120,7 +125,9 @@ class Stholes(object):
             for child in new_bucket.children:
                 child.father = self
             self.intervalles = new_bucket.intervalles
+            self.invalider_cache()
             self.howasicreated = new_bucket.howasicreated
+            self.nb_classe -= 1
             new_bucket = None  # Pour s'assurer qu'on le détruise (necessaire ?)
             # On màj les classes qui avaient une meilleure fusion avec b1 (le fils fussioné)
             for classe in self.children:
@@ -139,6 +146,9 @@ class Stholes(object):
             if nb_tuple_to_remove is not None:
                 changing_bucket.nb_tuple -= nb_tuple_to_remove
             changing_bucket.children.append(new_bucket)
+            changing_bucket.invalider_cache()
+            # Que la fusion soit pc ou ss, une seule classe disparait (les classes absorbées deviennent filles)
+            self.racine().nb_classe -= 1
             new_bucket.update_penalities()
             if fusion_pc:
                 for c in changing_bucket.children:
@@ -195,7 +205,7 @@ class Stholes(object):
             nb_tuple_dans_intervalle = requete[1] * x
             if v_int > epsilon:  # Si le volume intérieur est non nul ie si la requête ne tombe pas dans un fils
                 tab_res = [(self, nb_tuple_dans_intervalle)]
-            for child in self.children:
+            for child in self.fils_candidats(requete[0]):
                 tab_res += child.nb_tuple_intervalles(requete)
         return tab_res
 
@@ -216,7 +226,7 @@ class Stholes(object):
         pénalité associée à cette fusion.
         """
         # Creation du nouvel intervalle ================================================================================
-        n_b = Stholes(self.attributes_name, self.nb_max_classes)
+        n_b = Stholes(self.attributes_name, self.nb_max_classes, nb_voisins=self.nb_voisins)
         n_b.penalities = self.penalities
         n_b.nb_tuple = self.nb_tuple + child.nb_tuple
         n_b.father = self.father
@@ -241,25 +251,40 @@ class Stholes(object):
         à cette fusion et une liste d'intervalle appartenant à self qui appartiendrait à l'intervalle obtenu suite à la
         fusion.
         """
-        if self.v() == 0:
-            # Dans ce cas, les fils occupent tout l'espace, il faut fusionner les fils pour faire une fusion père fils plus tard
+        intervalles, penality, to_rm, nb_tuple_to_rm_from_p = self.evaluer_ss(child1, child2)
+        if intervalles is None:
             return None, None, None, None
         # Création du nouvelle intervalle ==============================================================================
-        n_b = Stholes(self.attributes_name, self.nb_max_classes)
+        n_b = Stholes(self.attributes_name, self.nb_max_classes, nb_voisins=self.nb_voisins)
         n_b.penalities = self.penalities
         n_b.father = child1.father
-        n_b.intervalles = [[min(child1.intervalles[dim][0], child2.intervalles[dim][0]), max(child1.intervalles[dim][1], child2.intervalles[dim][1])]
-                           for dim in range(len(self.intervalles))]
+        n_b.intervalles = intervalles
         n_b.howasicreated = 0
         for c in child1.children:
             n_b.children.append(c)
         for c in child2.children:
             n_b.children.append(c)
+        for c in to_rm[2:]:
+            n_b.children.append(c)
+        n_b.nb_tuple = nb_tuple_to_rm_from_p + child1.nb_tuple + child2.nb_tuple
+        return n_b, penality, to_rm, nb_tuple_to_rm_from_p
+
+    def evaluer_ss(self, child1, child2):
+        """
+        Calcule la fusion de deux fils de self sans créer la classe résultante (cf. merge_ss).
+        :param child1:
+        :param child2:
+        :return: Les intervalles de la fusion, la pénalité, la liste des fils de self absorbés par la fusion et le nombre
+        de tuple retiré au père.
+        """
+        if self.v() == 0:
+            # Dans ce cas, les fils occupent tout l'espace, il faut fusionner les fils pour faire une fusion père fils plus tard
+            return None, None, None, None
+        intervalles = [[min(child1.intervalles[dim][0], child2.intervalles[dim][0]), max(child1.intervalles[dim][1], child2.intervalles[dim][1])]
+                       for dim in range(len(self.intervalles))]
 
         # Liste des classes à tester pour savoir si elles intersectent le résultat de la fusion ========================
-        a_verifier = copy(self.children)
-        a_verifier.remove(child1)
-        a_verifier.remove(child2)
+        a_verifier = [c for c in self.children if c is not child1 and c is not child2]
         to_rm = [child1, child2]  # Liste des classes à enlever du père si l'on selectionne cette fusion.
 
         # Le parcours qui suit de la liste des classes à vérifier est un peu particulier, on ne retire des classes de
@@ -271,50 +296,52 @@ class Stholes(object):
         while cpt >= 0:
             current = a_verifier[cpt]
             change_la_taille = False
-            if current.est_inclus(n_b.intervalles):
+            if current.est_inclus(intervalles):
                 to_rm.append(current)
-                n_b.children.append(current)
-                a_verifier.remove(current)
-            elif current.intersect(n_b.intervalles):
-                for dim in range(len(n_b.intervalles)):
-                    if n_b.intervalles[dim][0] <= current.intervalles[dim][0] <= n_b.intervalles[dim][1] <= current.intervalles[dim][1]:
+                del a_verifier[cpt]
+            elif current.intersect(intervalles):
+                for dim in range(len(intervalles)):
+                    if intervalles[dim][0] <= current.intervalles[dim][0] <= intervalles[dim][1] <= current.intervalles[dim][1]:
                         # la classe courante dépasse à droite
-                        n_b.intervalles[dim][1] = current.intervalles[dim][1]
+                        intervalles[dim][1] = current.intervalles[dim][1]
                         change_la_taille = True
-                    elif current.intervalles[dim][0] <= n_b.intervalles[dim][0] <= current.intervalles[dim][1] <= n_b.intervalles[dim][1]:
+                    elif current.intervalles[dim][0] <= intervalles[dim][0] <= current.intervalles[dim][1] <= intervalles[dim][1]:
                         # la classe courante dépasse à gauche
-                        n_b.intervalles[dim][0] = current.intervalles[dim][0]
+                        intervalles[dim][0] = current.intervalles[dim][0]
                         change_la_taille = True
-                    elif current.intervalles[dim][0] <= n_b.intervalles[dim][0] <= n_b.intervalles[dim][1] <= current.intervalles[dim][1]:
+                    elif current.intervalles[dim][0] <= intervalles[dim][0] <= intervalles[dim][1] <= current.intervalles[dim][1]:
                         # la classe courante dépasse des deux côtés
-                        n_b.intervalles[dim][0] = current.intervalles[dim][0]
-                        n_b.intervalles[dim][1] = current.intervalles[dim][1]
+                        intervalles[dim][0] = current.intervalles[dim][0]
+                        intervalles[dim][1] = current.intervalles[dim][1]
                         change_la_taille = True
             if change_la_taille:
                 to_rm.append(current)
-                n_b.children.append(current)
-                a_verifier.remove(current)
+                del a_verifier[cpt]
                 cpt = len(a_verifier)-1
             else:
                 cpt -= 1
 
         # Calcul du nombre de tuple ====================================================================================
         # p = père, n = nouveau
+        # Volumes de la fusion : les fils de la fusion sont les fils de child1, de child2 puis les classes absorbées.
+        v_box = volume(intervalles)
+        v_n = v_box - sum([c.vBox() for c in child1.children] + [c.vBox() for c in child2.children] +
+                          [c.vBox() for c in to_rm[2:]])
         # vold correspond au volume qu'occupait le père à la place de la fusion.
-        vold = n_b.vBox() - sum([intervalle.vBox() for intervalle in to_rm])
+        vold = v_box - sum([intervalle.vBox() for intervalle in to_rm])
         # vn correspond au volume de la nouvelle
         vn = vold + child1.vBox() + child2.vBox()
         nb_tuple_to_rm_from_p = self.nb_tuple * (vold / self.v())
-        n_b.nb_tuple = nb_tuple_to_rm_from_p + child1.nb_tuple + child2.nb_tuple
+        nb_tuple = nb_tuple_to_rm_from_p + child1.nb_tuple + child2.nb_tuple
         # Calcul de la pénalitée ===================================================================================
         # Pénalité du à l'estimation de la zone "old"
-        p1 = abs(self.nb_tuple * (vold / self.v()) - n_b.nb_tuple * (vold / n_b.v()))
+        p1 = abs(self.nb_tuple * (vold / self.v()) - nb_tuple * (vold / v_n))
         # Pénalité dû à l'estimation du fils 1
-        p2 = abs(child1.nb_tuple - n_b.nb_tuple * (child1.v() / vn))
+        p2 = abs(child1.nb_tuple - nb_tuple * (child1.v() / vn))
         # Pénalité dû à l'estimation du fils 2
-        p3 = abs(child2.nb_tuple - n_b.nb_tuple * (child2.v() / vn))
+        p3 = abs(child2.nb_tuple - nb_tuple * (child2.v() / vn))
         penality = p1 + p2 + p3
-        return n_b, penality, to_rm, nb_tuple_to_rm_from_p
+        return intervalles, penality, to_rm, nb_tuple_to_rm_from_p
 
     def update_penalities(self):
         if self.father is not None:
@@ -323,16 +350,31 @@ class Stholes(object):
             _, penality = self.father.merge_pc(self)
             best_p = penality
             best_c = self.father
-            for c in self.father.children:
-                if c is not self:
-                    if c.father is not self.father:
-                        raise ValueError("F")
-                    _, penality, _, _ = self.father.merge_ss(self, c)
-                    if penality is not None and penality < best_p:
-                        best_p = penality
-                        best_c = c
+            for c in self.voisins():
+                if c.father is not self.father:
+                    raise ValueError("F")
+                _, penality, _, _ = self.father.evaluer_ss(self, c)
+                if penality is not None and penality < best_p:
+                    best_p = penality
+                    best_c = c
             self.penalities[self] = [best_c, best_p]
 
+    def voisins(self):
+        """
+        Renvoit les frères avec lesquels tester une fusion ss : tous les frères, ou seulement les nb_voisins frères
+        dont le centre est le plus proche du centre de self lorsqu'il y en a davantage.
+        :return: Liste des frères dans l'ordre de father.children
+        """
+        freres = [c for c in self.father.children if c is not self]
+        if self.nb_voisins is None or len(freres) <= self.nb_voisins:
+            return freres
+        centre = [b[0] + b[1] for b in self.intervalles]  # Le double du centre suffit pour comparer les distances
+
+        def distance(c):
+            return sum([(b[0] + b[1] - m) ** 2 for b, m in zip(c.intervalles, centre)])
+        proches = set(nsmallest(self.nb_voisins, freres, key=distance))
+        return [c for c in freres if c in proches]
+
     def drill(self, zone, nb_tuple):
         """
         Cette méthode permet de créer un nouvel intervalle de boundary zone avec nb_tuple tuples.
@@ -350,7 +392,9 @@ class Stholes(object):
                 if child.intersect(zone) and not child.est_inclus(zone):
                     raise ValueError("Un des fils chevauchait-il self ?")
             self.father.children = n_b.children
+            self.father.invalider_cache()
             self.father.nb_tuple = n_b.nb_tuple
+            self.racine().nb_classe -= 1
             del self.penalities[self]
             for child in self.father.children:
                 # On ne met pas à jour les fils qui pointaient vers le père car le père est souvent très proche  du
@@ -368,7 +412,7 @@ class Stholes(object):
                 raise ValueError("Creuser ne fonctionne pas bien")
         else:
             # Création d'un nouvel intervalle
-            b_n = Stholes(self.attributes_name, self.nb_max_classes)
+            b_n = Stholes(self.attributes_name, self.nb_max_classes, nb_voisins=self.nb_voisins)
             b_n.nb_tuple = nb_tuple
             b_n.intervalles = deepcopy(zone)
             b_n.father = self
@@ -387,6 +431,9 @@ class Stholes(object):
                     raise ValueError("Un des fils coupe la zone à creuser !")
             tmp = copy(tab_class_to_update)
             self.children.append(b_n)
+            self.invalider_cache()
+            b_n.invalider_cache()
+            self.racine().nb_classe += 1
             self.nb_tuple = max(0, self.nb_tuple - nb_tuple)
             b_n.update_penalities()
             for child in self.children:
@@ -406,7 +453,7 @@ class Stholes(object):
 
         # Liste des enfants qui intersect la requêtes partiellement ====================================================
         participants = []
-        for child in self.children:
+        for child in self.fils_candidats(trou_candidat):
             # On fait la liste des fils participant ====================================================================
             if child.intersect(trou_candidat) and not child.est_inclus(trou_candidat):
                 participants.append(child)
@@ -437,7 +484,7 @@ class Stholes(object):
 
             # Mise à jour des participants =============================================================================
             # Après avoir coupé, il faut vérifier que l'on n'ait pas rajouté un candidat qui était inclus
-            for child in self.children:
+            for child in self.fils_candidats(trou_candidat):
                 if child.intersect(trou_candidat) and not child.est_inclus(trou_candidat) and child not in participants:
                     participants.append(child)
             for p in reversed(participants):
@@ -448,14 +495,14 @@ class Stholes(object):
         for dim in trou_candidat:
             v_trou_candidat *= (dim[1] - dim[0])
         # On retire au volume du trou candidat le volume des trous qui l'intersect =====================================
-        for child in self.children:
+        for child in self.fils_candidats(trou_candidat):
             if child.est_inclus(trou_candidat):
                 v_trou_candidat -= child.vBox()
         v_int = self.v_inter(bound_requete)  # Volume intervalle avant le shrink
         # Le min est la pour les problèmes d'arrondi
         x = min(v_trou_candidat / v_int, 1)  # TODO : Problème ici sur le calcul du rapport de volume
         T = nb_tuple * x  # Estimation du nombre de tuple dans le trou candidat
-        for c in self.children:
+        for c in self.fils_candidats(trou_candidat):
             if c.intersect(trou_candidat) and not c.est_inclus(trou_candidat):
                 raise ValueError('Un des fils intersectionne le trou candidat')
         return trou_candidat, T
@@ -478,6 +525,7 @@ class Stholes(object):
                     self.intervalles[dim] = [requete[0][dim][0], self.intervalles[dim][1]]
                 if requete[0][dim][1] > self.intervalles[dim][1]:
                     self.intervalles[dim] = [self.intervalles[dim][0], requete[0][dim][1]]
+        self.invalider_cache()
 
     def estimer(self, dim_a_estimer, bound):
         """
@@ -515,10 +563,19 @@ class Stholes(object):
         v, vol_tot = volume_inter(self.intervalles, bound, dim_a_estimer, self.attributes_name)
         if v == 0:  # on est tombé dans le cas sans intersection
             return 0
-        for child in self.children:
-            v_child, v_tot_child = volume_inter(child.intervalles, bound, dim_a_estimer, self.attributes_name)
+        # Le volume total ne dépend pas de la requête, seulement des dimensions estimées
+        cle = tuple(dim_a_estimer)
+        if cle in self.volume_projete:
+            vol_tot = self.volume_projete[cle]
+        else:
+            for child in self.children:
+                vol_tot -= volume_inter(child.intervalles, bound, dim_a_estimer, self.attributes_name)[1]
+            self.volume_projete[cle] = vol_tot
+        # Les fils écartés par l'index n'intersectent pas la zone : leur volume d'intersection et leur estimation sont nuls
+        candidats = self.fils_candidats(bound, [self.attributes_name.index(d) for d in dim_a_estimer])
+        for child in candidats:
+            v_child, _ = volume_inter(child.intervalles, bound, dim_a_estimer, self.attributes_name)
             v -= v_child
-            vol_tot -= v_tot_child
         if vol_tot < epsilon:  # Cas spécial où l'intervalle est entièrement occupé par ces fils.
             # Il faut le traiter à part pour éviter une division par zéro
             res = 0
@@ -526,28 +583,122 @@ class Stholes(object):
             v = min(v, vol_tot)  # Il est possible que suite à un problème de virgule flotante, le vol_tot soit plus
             # petit que v, on essaie de pallier à ce problème ne forçant l'égalité en cas de problème
             res = self.nb_tuple * (v/vol_tot)
-        for child in self.children:
+        for child in candidats:
             res += child.estimer(dim_a_estimer, bound)
         return res
 
+    def estimer_batch(self, dim_a_estimer, zones, taille_bloc=2 ** 20):
+        """
+        Renvoie l'estimation de plusieurs zones portant sur les mêmes dimensions en une seule fois. Le calcul est le même
+        que celui de la méthode "estimer" mais il est réalisé sur les tableaux de frontières de toutes les classes.
+        :param dim_a_estimer: Liste des noms des dimensions à estimer.
+        :param zones: Tableau de forme (nb_zone, len(dim_a_estimer), 2) des intervalles [min, max] de chaque zone.
+        :param taille_bloc: Nombre maximal d'éléments des tableaux intermédiaires, les zones sont traitées par paquet.
+        :return: np.ndarray des estimations
+        """
+        tab_dim = [self.attributes_name.index(dim) for dim in dim_a_estimer]
+        zones = np.asarray(zones, dtype=np.float64)
+        bornes_inf, bornes_sup, nb_tuple, pere, profondeur = self.empaqueter()
+        bornes_inf = bornes_inf[:, tab_dim]
+        bornes_sup = bornes_sup[:, tab_dim]
+        a_un_pere = pere >= 0
+        # On retranche à chaque classe le volume de ses fils
+        vol_tot = (bornes_sup - bornes_inf).prod(axis=1)
+        vol_libre = vol_tot.copy()
+        np.subtract.at(vol_libre, pere[a_un_pere], vol_tot[a_un_pere])
+        resultat = np.empty(len(zones))
+        pas_bloc = max(1, taille_bloc // max(1, bornes_inf.size))
+        for debut in range(0, len(zones), pas_bloc):
+            bloc = zones[debut:debut + pas_bloc]
+            # Volume de l'intersection de chaque zone avec chaque classe (nb_zone, nb_classe)
+            longueur = np.minimum(bloc[:, np.newaxis, :, 1], bornes_sup) - np.maximum(bloc[:, np.newaxis, :, 0], bornes_inf)
+            v = np.clip(longueur, 0, None).prod(axis=2)
+            v_libre = v.T.copy()
+            np.subtract.at(v_libre, pere[a_un_pere], v.T[a_un_pere])
+            v_libre = np.minimum(v_libre.T, vol_libre)
+            res = np.where(vol_libre < epsilon, 0, nb_tuple * np.divide(v_libre, vol_libre, out=np.zeros_like(v_libre),
+                                                                        where=vol_libre >= epsilon))
+            # Une classe qui n'intersectionne pas la zone ne contribue pas, pas plus que ses descendants
+            contribue = v != 0
+            for p in range(1, profondeur.max(initial=0) + 1):
+                niveau = profondeur == p
+                contribue[:, niveau] &= contribue[:, pere[niveau]]
+            resultat[debut:debut + pas_bloc] = np.where(contribue, res, 0).sum(axis=1)
+        return resultat
+
+    def empaqueter(self):
+        """
+        Parcourt l'arbre et rassemble les informations des classes dans des tableaux numpy.
+        :return: (bornes_inf, bornes_sup, nb_tuple, pere, profondeur) où pere est l'index du père de chaque classe (-1
+        pour la racine) et profondeur sa profondeur dans l'arbre.
+        """
+        bornes = []
+        nb_tuple = []
+        pere = []
+        profondeur = []
+        a_visiter = [(self, -1, 0)]
+        while a_visiter:
+            classe, id_pere, p = a_visiter.pop()
+            id_classe = len(bornes)
+            bornes.append(classe.intervalles)
+            nb_tuple.append(classe.nb_tuple)
+            pere.append(id_pere)
+            profondeur.append(p)
+            for child in classe.children:
+                a_visiter.append((child, id_classe, p + 1))
+        bornes = np.array(bornes, dtype=np.float64)
+        return bornes[:, :, 0], bornes[:, :, 1], np.array(nb_tuple, dtype=np.float64), np.array(pere), \
+            np.array(profondeur)
+
     def vBox(self):
         """
         Cette fonction renvoit le volume brut d'un boundary. C'est à dire le produit des longuers de l'boundary dans
-        chaque dimensions.
+        chaque dimensions. Le volume est mis en cache jusqu'au prochain appel de invalider_cache.
         :return:
         """
-        volume = 1
-        for b in self.intervalles:
-            volume *= (b[1] - b[0])
-        return volume
+        if self.volume_boite is None:
+            volume = 1
+            for b in self.intervalles:
+                volume *= (b[1] - b[0])
+            self.volume_boite = volume
+        return self.volume_boite
 
     def v(self):
         """
         Renvoit le volume d'un boundary, c'est à dire le volume brut de l'boundary auquel on retranche le volume de
-        ces fils.
+        ces fils. La somme des volumes des fils est mise en cache jusqu'au prochain appel de invalider_cache.
+        :return:
+        """
+        if self.volume_fils is None:
+            self.volume_fils = sum([child.vBox() for child in self.children])
+        return self.vBox() - self.volume_fils
+
+    def invalider_cache(self):
+        """
+        À appeler dès que les intervalles ou les fils de la classe sont modifiés.
         :return:
         """
-        return self.vBox() - sum([child.vBox() for child in self.children])
+        self.volume_boite = None
+        self.volume_fils = None
+        self.volume_projete = {}
+        self.index_fils = None
+
+    def fils_candidats(self, bound, tab_dim=None):
+        """
+        Renvoit les fils qui peuvent intersecter la frontière, dans l'ordre de self.children. Au delà de seuil_index fils,
+        on passe par un index des frontières des fils qui écarte d'un coup ceux qui sont hors de la frontière.
+        :param bound: frontière sur les dimensions tab_dim
+        :param tab_dim: index des dimensions de bound, toutes les dimensions si None
+        :return:
+        """
+        if len(self.children) <= seuil_index:
+            return self.children
+        if self.index_fils is None:
+            bornes = np.array([child.intervalles for child in self.children], dtype=np.float64)
+            self.index_fils = Index(bornes[:, :, 0], bornes[:, :, 1])
+        if tab_dim is None:
+            tab_dim = range(len(self.intervalles))
+        return [self.children[i] for i in self.index_fils.candidats(tab_dim, bound)]
 
     def vBox_inter(self, bound):
         """
@@ -574,22 +725,29 @@ class Stholes(object):
         """
         if self.intersect(req_bound):
             res = self.vBox_inter(req_bound)
-            for child in self.children:
+            for child in self.fils_candidats(req_bound):
                 res -= child.vBox_inter(req_bound)
         else:
             res = 0
         return res
 
-    def count_nb_bucket(self):
+    def racine(self):
         """
-        Remonte au noeud père puis lance la méthode count_your_child.
-        :return: Le nombre d'intervalle que contient l'histogramme.
+        Remonte jusqu'à la racine de l'histogramme.
+        :return: Stholes
         """
         current_bucket = self
         while current_bucket.father is not None:  # On cherche l'boundary racine
             current_bucket = current_bucket.father
-        # On utilise une fonction récursive pour compter le nombre d'boundary crée juqu'à maintenant
-        return current_bucket.count_your_child() + 1
+        return current_bucket
+
+    def count_nb_bucket(self):
+        """
+        Remonte au noeud père puis lit le compteur tenu à jour par drill et delete_bucket (cf. count_your_child pour
+        un recomptage complet).
+        :return: Le nombre d'intervalle que contient l'histogramme.
+        """
+        return self.racine().nb_classe
 
     def count_your_child(self):
         """
@@ -633,6 +791,8 @@ class Stholes(object):
         size_node += getsizeof(self.attributes_name)
         size_node += getsizeof(self.intervalles)
         size_node += getsizeof(self.penalities)
+        if self.index_fils is not None:
+            size_node += self.index_fils.get_size()
         for child in self.children:
             size_node += child.get_size()
         return size_node
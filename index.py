@@ -0,0 +1,72 @@
+# -*- coding: UTF-8 -*-
+"""
+:author : Cyril MOINEAU
+:creation_date : 18/10/26
+:last_change_date : 18/10/26
+:description : Index de classes (boîtes) selon leurs frontières, partagé par les histogrammes MHIST et ST-Holes.
+"""
+import numpy as np
+
+
+class Index(object):
+    def __init__(self, bornes_inf, bornes_sup):
+        """
+        Index construit sur un ensemble de classes qui ne change plus. Pour chaque dimension, on conserve les classes
+        triées selon leur borne inférieure et selon leur borne supérieure, ce qui permet de ne visiter que les classes
+        qui intersectent la zone à estimer.
+        :param bornes_inf: Tableau des bornes inférieures de forme (nb_classe, nb_dim)
+        :param bornes_sup: Tableau des bornes supérieures de forme (nb_classe, nb_dim)
+        """
+        self.bornes_inf = bornes_inf
+        self.bornes_sup = bornes_sup
+        self.ordre_inf = np.argsort(bornes_inf, axis=0, kind='stable')
+        self.ordre_sup = np.argsort(bornes_sup, axis=0, kind='stable')
+        self.inf_tries = np.take_along_axis(bornes_inf, self.ordre_inf, axis=0)
+        self.sup_tries = np.take_along_axis(bornes_sup, self.ordre_sup, axis=0)
+
+    @staticmethod
+    def depuis_classes(tab_classe):
+        """
+        Construit l'index à partir des frontières d'une liste de classes MHIST.
+        :param tab_classe:
+        :return: Index
+        """
+        bornes = np.array([c.boundaries for c in tab_classe], dtype=np.float64)
+        return Index(bornes[:, :, 0], bornes[:, :, 1])
+
+    def candidats(self, tab_dim, intervalle):
+        """
+        Renvoit les index (dans l'ordre croissant) des classes qui intersectent la zone.
+        :param tab_dim: Liste des index des dimensions de la zone.
+        :param intervalle: Liste d'intervalle [min, max] pour chaque dimension de tab_dim.
+        :return: np.ndarray
+        """
+        # On part de la dimension la plus sélective : sur chaque dimension, les classes dont la borne inférieure est
+        # inférieure au max de la zone forment un préfixe, celles dont la borne supérieure est supérieure au min de la
+        # zone forment un suffixe.
+        meilleur = None
+        for d, (mini, maxi) in zip(tab_dim, intervalle):
+            fin = np.searchsorted(self.inf_tries[:, d], maxi, side='right')
+            debut = np.searchsorted(self.sup_tries[:, d], mini, side='left')
+            if meilleur is None or fin < meilleur[0]:
+                meilleur = (fin, self.ordre_inf[:fin, d])
+            if meilleur[0] > len(self.sup_tries) - debut:
+                meilleur = (len(self.sup_tries) - debut, self.ordre_sup[debut:, d])
+        if meilleur is None:
+            return np.arange(len(self.bornes_inf))
+        index = meilleur[1]
+        garder = np.ones(len(index), dtype=bool)
+        for d, (mini, maxi) in zip(tab_dim, intervalle):
+            garder &= (self.bornes_inf[index, d] <= maxi) & (self.bornes_sup[index, d] >= mini)
+        return np.sort(index[garder])
+
+    def get_size(self, avec_bornes=True):
+        """
+        Renvoit l'espace de stockage necessaire pour l'index.
+        :param avec_bornes: boolean : compte aussi les tableaux de bornes (à désactiver s'ils sont partagés).
+        :return:
+        """
+        size = self.ordre_inf.nbytes + self.ordre_sup.nbytes + self.inf_tries.nbytes + self.sup_tries.nbytes
+        if avec_bornes:
+            size += self.bornes_inf.nbytes + self.bornes_sup.nbytes
+        return size
@@ -0,0 +1,102 @@
+# -*- coding: UTF-8 -*-
+"""
+:author : Cyril MOINEAU
+:creation_date : 18/10/26
+:last_change_date : 18/10/26
+:description : Outils partagés par les histogrammes MHIST et GENHIST : tableaux numpy placés en mémoire partagée pour
+les constructions parallèles et finaliseur de splitmix64 pour les tirages et empreintes pseudo-aléatoires.
+"""
+from sys import version_info
+import numpy as np
+
+# Tableaux partagés vus par un processus d'une construction parallèle (cf. attacher_memoire)
+tableaux_partages = {}
+
+
+def verifier_memoire_partagee():
+    """
+    Les constructions parallèles reposent sur multiprocessing.shared_memory, disponible à partir de Python 3.8.
+    :return: None
+    """
+    if version_info < (3, 8):
+        raise ValueError('ERREUR : nb_processus nécessite Python 3.8 ou plus (version utilisée : '
+                         + '.'.join(str(v) for v in version_info[:3]) + ') !')
+
+
+class MemoirePartagee(object):
+    def __init__(self, tableaux):
+        """
+        Gestionnaire de contexte créant des tableaux numpy en mémoire partagée et libérant cette mémoire en sortie.
+        Les tableaux rendus doivent être supprimés (del) avant la sortie du bloc with, sinon la mémoire ne peut pas
+        être fermée ; elle est alors libérée par le ramasse-miettes.
+        :param tableaux: Liste de triplets (clef, forme, type) des tableaux à créer.
+        """
+        self.tableaux = tableaux
+        self.memoires = []
+        self.description = []
+
+    def __enter__(self):
+        """
+        :return: dict clef -> np.ndarray en mémoire partagée (non initialisé)
+        """
+        from multiprocessing import shared_memory
+        tableaux = {}
+        try:
+            for cle, forme, type_donnee in self.tableaux:
+                type_donnee = np.dtype(type_donnee)
+                memoire = shared_memory.SharedMemory(create=True,
+                                                     size=max(1, int(np.prod(forme)) * type_donnee.itemsize))
+                self.memoires.append(memoire)
+                tableaux[cle] = np.ndarray(forme, dtype=type_donnee, buffer=memoire.buf)
+                self.description.append((cle, memoire.name, tuple(forme), type_donnee.str))
+        except BaseException:
+            tableaux.clear()
+            self.liberer()
+            raise
+        return tableaux
+
+    def __exit__(self, type_exception, exception, trace):
+        self.liberer()
+        return False
+
+    def liberer(self):
+        """
+        Ferme et supprime les mémoires partagées. Une erreur lors de la fermeture (BufferError si un tableau référence
+        encore la mémoire, par exemple depuis la trace d'une exception) ne doit ni empêcher la suppression des autres
+        mémoires ni masquer l'exception d'origine.
+        :return: None
+        """
+        for memoire in self.memoires:
+            try:
+                memoire.close()
+            except BufferError:
+                pass
+            try:
+                memoire.unlink()
+            except FileNotFoundError:
+                pass
+        self.memoires = []
+
+
+def attacher_memoire(description):
+    """
+    Initialisation d'un processus d'une construction parallèle : on s'attache à la mémoire partagée.
+    :param description: Liste de quadruplets (clef, nom, forme, type) des tableaux (cf. MemoirePartagee.description).
+    :return: None
+    """
+    from multiprocessing import shared_memory
+    for cle, nom, forme, type_donnee in description:
+        memoire = shared_memory.SharedMemory(name=nom)
+        tableaux_partages[cle] = np.ndarray(forme, dtype=type_donnee, buffer=memoire.buf)
+        tableaux_partages['memoire_' + cle] = memoire
+
+
+def splitmix64(z):
+    """
+    Finaliseur de splitmix64 : mélange les bits de chaque entier pour obtenir une valeur pseudo-aléatoire sur 64 bits.
+    :param z: np.ndarray d'entiers non signés sur 64 bits
+    :return: np.ndarray d'entiers non signés sur 64 bits
+    """
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return z ^ (z >> np.uint64(31))
@@ -0,0 +1,178 @@
+# -*- coding: UTF-8 -*-
+
+"""
+:author : Cyril MOINEAU
+:creation_date : 18/10/26
+:last_change_date : 18/10/26
+:description : Script vérifiant, sur un jeu de données aléatoire à graine fixée, que les différentes manières de
+construire et d'interroger un histogramme donnent le même résultat (construction parallèle et séquentielle, données en
+listes ou en tableaux numpy, grille dense ou creuse, estimations une à une ou par lot, avec ou sans index).
+"""
+import random
+import sys
+import numpy as np
+import MHIST.Mhist as mhist
+import GENHIST.Genhist as genhist
+import AVI.avi as avi
+from STHOLES import Stholes as st
+from STHOLES import Workload as w
+
+# Définition des variables =============================================================================================
+graine = 0
+nb_tuple = 4000
+nb_zone = 300
+noms = ['x', 'y', 'z']
+# Les constructions parallèles nécessitent multiprocessing.shared_memory
+parallele = sys.version_info >= (3, 8)
+
+
+def creer_jeu_de_donnees():
+    """
+    Jeu de données corrélé en 3 dimensions. Les valeurs sont arrondies pour avoir des valeurs répétées.
+    :return: np.ndarray de forme (3, nb_tuple)
+    """
+    rng = np.random.default_rng(graine)
+    x = rng.normal(0, 1, nb_tuple)
+    y = x + rng.normal(0, 1, nb_tuple)
+    z = rng.exponential(0.5, nb_tuple)
+    return np.round(np.vstack([x, y, z]), 1)
+
+
+def creer_zones(data):
+    """
+    Zones à estimer pour chaque sous-ensemble d'attributs testé.
+    :param data: np.ndarray de forme (nb_dim, nb_tuple)
+    :return: Liste de couples (attributs, np.ndarray de forme (nb_zone, len(attributs), 2))
+    """
+    rng = np.random.default_rng(graine + 1)
+    requetes = []
+    for attributs in (['x'], ['y', 'z'], ['x', 'y', 'z'], ['z', 'x']):
+        dims = [noms.index(a) for a in attributs]
+        mini, maxi = data[dims].min(axis=1), data[dims].max(axis=1)
+        centres = rng.uniform(mini, maxi, (nb_zone, len(dims)))
+        demi_largeurs = rng.uniform(0, 0.3, (nb_zone, len(dims))) * (maxi - mini)
+        requetes.append((attributs, np.stack([centres - demi_largeurs, centres + demi_largeurs], axis=2)))
+    return requetes
+
+
+def estimations(histo, requetes, methode='estimer'):
+    """
+    :return: np.ndarray de toutes les estimations faites une à une
+    """
+    return np.array([getattr(histo, methode)(attributs, zone.tolist()) for attributs, zones in requetes
+                     for zone in zones])
+
+
+def estimations_batch(histo, requetes):
+    """
+    :return: np.ndarray de toutes les estimations faites par lot
+    """
+    return np.concatenate([histo.estimer_batch(attributs, zones) for attributs, zones in requetes])
+
+
+def tableaux_egaux(a, b):
+    """
+    :return: True si les deux suites de tableaux numpy sont identiques
+    """
+    return len(a) == len(b) and all(np.array_equal(x, y) for x, y in zip(a, b))
+
+
+def verifier_mhist(data, requetes):
+    nb_intervalle = 150
+    histo = mhist.Mhist(data, noms, nb_intervalle)
+    reference = estimations(histo, requetes)
+
+    histo_liste = mhist.Mhist(data.tolist(), noms, nb_intervalle)
+    assert tableaux_egaux(histo.empaqueter(), histo_liste.empaqueter()), 'MHIST : listes et tableaux numpy diffèrent'
+    assert np.allclose(estimations(histo_liste, requetes), reference, rtol=1e-12, atol=0), \
+        'MHIST : listes et tableaux numpy donnent des estimations différentes'
+
+    assert np.allclose(estimations_batch(histo, requetes), reference, rtol=1e-12, atol=0), \
+        'MHIST : estimer_batch et estimer diffèrent'
+
+    histo_index = mhist.Mhist(data, noms, nb_intervalle, index=True)
+    assert np.allclose(estimations(histo_index, requetes), reference, rtol=1e-12, atol=0), \
+        'MHIST : l\'index change les estimations'
+    histo_index.compact()
+    assert np.allclose(estimations(histo_index, requetes), reference, rtol=1e-12, atol=0), \
+        'MHIST : l\'histogramme compacté change les estimations'
+
+    if parallele:
+        histo_parallele = mhist.Mhist(data, noms, nb_intervalle, nb_processus=2)
+        assert tableaux_egaux(histo.empaqueter(), histo_parallele.empaqueter()), \
+            'MHIST : la construction parallèle (nb_split_par_tour=1) diffère de la construction séquentielle'
+    print('MHIST OK')
+
+
+def verifier_genhist(data, requetes):
+    b = 10
+    xi = 8
+    alpha = (1 / 2) ** (1 / len(noms))
+    histo = genhist.Genhist(data, noms, b, xi, alpha, graine=graine)
+    reference = estimations(histo, requetes)
+
+    histo_creuse = genhist.Genhist(data, noms, b, xi, alpha, graine=graine, creuse=True)
+    assert tableaux_egaux(histo.paquet, histo_creuse.paquet), 'GENHIST : grilles dense et creuse diffèrent'
+
+    histo_liste = genhist.Genhist(data.tolist(), noms, b, xi, alpha, graine=graine)
+    assert tableaux_egaux(histo.paquet, histo_liste.paquet), 'GENHIST : listes et tableaux numpy diffèrent'
+
+    assert np.allclose(estimations_batch(histo, requetes), reference, rtol=1e-12, atol=0), \
+        'GENHIST : estimer_batch et estimer diffèrent'
+
+    if parallele:
+        histo_parallele = genhist.Genhist(data, noms, b, xi, alpha, graine=graine, nb_processus=2)
+        assert tableaux_egaux(histo.paquet, histo_parallele.paquet), \
+            'GENHIST : la construction parallèle diffère de la construction séquentielle'
+    print('GENHIST OK')
+
+
+def verifier_stholes(data, requetes):
+    nb_bucket = 60
+    seuil_index = st.seuil_index
+    resultats = []
+    try:
+        # Index des fils toujours utilisé (seuil à 0) puis jamais utilisé
+        for seuil in (0, nb_tuple):
+            st.seuil_index = seuil
+            random.seed(graine)
+            workload = w.create_workload(data.tolist(), 0.05, 150)
+            histo = st.Stholes(noms, nb_bucket)
+            histo.BuildAndRefine(workload)
+            assert histo.count_nb_bucket() == histo.count_your_child() + 1, \
+                'STHOLES : le compteur de classes est faux'
+            resultats.append((histo.count_nb_bucket(), estimations(histo, requetes)))
+    finally:
+        st.seuil_index = seuil_index
+    (nb_indexe, avec_index), (nb, reference) = resultats
+    assert nb_indexe == nb and np.array_equal(avec_index, reference), 'STHOLES : l\'index change l\'histogramme'
+
+    assert np.allclose(estimations_batch(histo, requetes), reference, rtol=1e-9, atol=1e-9), \
+        'STHOLES : estimer_batch et estimer diffèrent'
+    # Zones traitées par petits paquets
+    par_paquet = np.concatenate([histo.estimer_batch(attributs, zones, taille_bloc=1000)
+                                 for attributs, zones in requetes])
+    assert np.allclose(par_paquet, reference, rtol=1e-9, atol=1e-9), \
+        'STHOLES : le découpage en paquets change les estimations'
+    print('STHOLES OK')
+
+
+def verifier_avi(data, requetes):
+    histo = avi.Avi(data.tolist(), noms)
+    reference = estimations(histo, requetes, 'estimation')
+    assert np.all(np.isfinite(reference)), 'AVI : estimation non finie'
+    # Les fractions de chaque dimension ne sont pas sommées dans le même ordre
+    assert np.allclose(estimations_batch(histo, requetes), reference, rtol=1e-9, atol=0), \
+        'AVI : estimer_batch et estimation diffèrent'
+    print('AVI OK')
+
+
+if __name__ == '__main__':
+    if not parallele:
+        print('Python < 3.8 : les constructions parallèles ne sont pas vérifiées')
+    data_set = creer_jeu_de_donnees()
+    zones_a_estimer = creer_zones(data_set)
+    verifier_mhist(data_set, zones_a_estimer)
+    verifier_genhist(data_set, zones_a_estimer)
+    verifier_stholes(data_set, zones_a_estimer)
+    verifier_avi(data_set, zones_a_estimer)